@@ -1,49 +1,193 @@
-import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import fitz
+import numpy as np
+import torch
+
+try:
+	import pypdfium2 as pdfium
+except Exception:
+	pdfium = None
 
 from app.services.ingester.core.model_loader import ModelLoader
 from app.services.ingester.core.nms_processor import NmsProcessor
 
+BLANK_STD_THRESHOLD = 2.0  # grey-level std-dev of a 72 dpi thumbnail below which a page is blank
+TRIAGE_DPI = 72
+RENDER_BACKENDS = ("pymupdf", "pdfium")
+
 # --- Classes ------------------------------------------------------------
 
 class PdfAnalyzer:
-	def __init__(self, confThreshold=0.4, iouThreshold=0.7, dpi=250):
+	def __init__(self, confThreshold=0.4, iouThreshold=0.7, dpi=250, batchSize=8, prefetchBatches=2,
+				 half=None, skipBlankPages=True, nativeTextPages=False, backend="pymupdf"):
+		if backend not in RENDER_BACKENDS:
+			raise ValueError(f"Unknown render backend: {backend}")
+		if backend == "pdfium" and pdfium is None:
+			raise RuntimeError("pypdfium2 is required for the 'pdfium' render backend.")
+
 		self.model = ModelLoader().load()
 		self.nms = NmsProcessor()
 		self.confThreshold = confThreshold
 		self.iouThreshold = iouThreshold
 		self.dpi = dpi
+		self.batchSize = batchSize  # pages per predict() call
+		self.prefetchBatches = prefetchBatches  # rendered batches allowed in flight
+		self.skipBlankPages = skipBlankPages  # no detections for visually empty pages
+		self.nativeTextPages = nativeTextPages  # text-only pages use PyMuPDF blocks, not YOLO
+		self.backend = backend  # rasterizer for full-resolution pages; triage stays on PyMuPDF
 
-	def analyze(self, filePath: str, maxPages: int = None):
-		doc = fitz.open(filePath)
+		# FP16 on GPU by default; layout detection is insensitive to the precision drop
+		cudaAvailable = torch.cuda.is_available()
+		self.device = 0 if cudaAvailable else 'cpu'
+		self.half = cudaAvailable if half is None else (half and cudaAvailable)
+
+	# doc: optional already-open fitz.Document to reuse (left open for the caller)
+	def analyze(self, filePath: str, maxPages: int = None, doc=None):
+		ownsDoc = doc is None
+		if ownsDoc:
+			doc = fitz.open(filePath)
+		rasterDoc = pdfium.PdfDocument(filePath) if self.backend == "pdfium" else None
 		results = []
 
 		totalPages = len(doc)
 		if maxPages:
 			totalPages = min(totalPages, maxPages)
 
-		for pageNum in range(totalPages):
-			page = doc[pageNum]
-			imgPath = f"temp_page_{pageNum}.png"
-			page.get_pixmap(dpi=self.dpi).save(imgPath)
-			detections = []
-
-			preds = self.model.predict(imgPath, imgsz=1024, conf=self.confThreshold)
-			if hasattr(preds[0], 'boxes'):
-				boxes = preds[0].boxes
-				for i in range(len(boxes)):
-					classId = int(boxes.cls[i])
-					conf = float(boxes.conf[i])
-					bbox = boxes.xyxy[i].tolist()
-					cls = preds[0].names[classId]
-					if cls == 'abandon':
-						continue
-					detections.append({'class_name': cls, 'bbox': bbox, 'conf': conf})
-
-			detections = self.nms.removeDuplicates(detections, iouThreshold=self.iouThreshold)
-			results.append({'page_number': pageNum + 1, 'detections': detections})
-			os.remove(imgPath)
-
-		doc.close()
+		# Render and detect in page batches to amortize model dispatch
+		batches = iter([
+			range(start, min(start + self.batchSize, totalPages))
+			for start in range(0, totalPages, self.batchSize)
+		])
+		pending = deque()
+		# Single render thread per call: neither PyMuPDF nor pdfium is safe to drive from
+		# several threads, but one producer thread overlaps rasterization with inference
+		renderPool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-render")
+		try:
+			for _ in range(self.prefetchBatches):
+				self._queueRender(pending, renderPool, doc, rasterDoc, next(batches, None))
+
+			while pending:
+				pageNums, future = pending.popleft()
+				prepared = future.result()  # [(image or None, detections or None)]
+				self._queueRender(pending, renderPool, doc, rasterDoc, next(batches, None))
+				preds = iter(self._predict([image for image, _ in prepared if image is not None]))
+
+				for pageNum, (image, detections) in zip(pageNums, prepared):
+					if image is not None:
+						detections = self._collectDetections(next(preds))
+					results.append({'page_number': pageNum + 1, 'detections': detections})
+		finally:
+			# Never close the document while the render thread may still be using it
+			for _, future in pending:
+				if not future.cancel():
+					future.exception()  # wait for an in-progress render
+			renderPool.shutdown()
+			if ownsDoc:
+				doc.close()
+			if rasterDoc is not None:
+				rasterDoc.close()
 		return results
+
+	# Schedule rendering of a page batch on the render thread
+	def _queueRender(self, pending, renderPool, doc, rasterDoc, pageNums):
+		if pageNums is None:
+			return
+		future = renderPool.submit(self._renderBatch, doc, rasterDoc, pageNums)
+		pending.append((pageNums, future))
+
+	def _renderBatch(self, doc, rasterDoc, pageNums):
+		return [self._preparePage(doc[pageNum], rasterDoc) for pageNum in pageNums]
+
+	def _predict(self, images):
+		if not images:
+			return []
+		return self.model.predict(
+			images,
+			imgsz=1024,
+			conf=self.confThreshold,
+			half=self.half,
+			device=self.device,
+			verbose=False,
+		)
+
+	# Triage a page: (None, detections) when the model can be skipped, else (image, None)
+	def _preparePage(self, page, rasterDoc=None):
+		if self.skipBlankPages and self._isBlankPage(page):
+			return None, []
+		if self.nativeTextPages:
+			detections = self._nativeTextDetections(page)
+			if detections is not None:
+				return None, detections
+		if rasterDoc is not None:
+			return self._renderPdfiumPage(rasterDoc, page.number), None
+		return self._renderPage(page), None
+
+	# Cheap low-res render; a near-uniform thumbnail means nothing to detect
+	def _isBlankPage(self, page):
+		thumb = page.get_pixmap(dpi=TRIAGE_DPI, colorspace=fitz.csGRAY, alpha=False)
+		return float(np.frombuffer(thumb.samples_mv, dtype=np.uint8).std()) < BLANK_STD_THRESHOLD
+
+	# Pages with only native text (no images/vector art) map text blocks to detections
+	def _nativeTextDetections(self, page):
+		if page.get_images() or page.get_drawings():
+			return None
+		blocks = [b for b in page.get_text("blocks") if b[6] == 0 and b[4].strip()]
+		if not blocks:
+			return None
+		toPixels = self.dpi / 72  # detections live in rendered-page pixel space
+		return [
+			{
+				'class_name': 'plain text',
+				'bbox': [x0 * toPixels, y0 * toPixels, x1 * toPixels, y1 * toPixels],
+				'conf': 1.0,
+			}
+			for x0, y0, x1, y1, *_ in blocks
+		]
+
+	# Render a page straight to an in-memory HxWx3 BGR array (no PNG encode/decode)
+	def _renderPage(self, page):
+		pix = page.get_pixmap(dpi=self.dpi, colorspace=fitz.csRGB, alpha=False)
+		return self._pixmapToArray(pix)
+
+	# Render through pdfium, whose default bitmap is already BGR
+	def _renderPdfiumPage(self, rasterDoc, pageIndex):
+		rasterPage = rasterDoc[pageIndex]
+		try:
+			bitmap = rasterPage.render(scale=self.dpi / 72)
+			img = bitmap.to_numpy()
+			if img.ndim == 3 and img.shape[2] == 4:
+				img = img[:, :, :3]
+			return np.ascontiguousarray(img)  # copy out before the bitmap is released
+		finally:
+			rasterPage.close()
+
+	# Wrap pixmap samples (zero-copy view) as the BGR layout the model expects
+	@staticmethod
+	def _pixmapToArray(pix):
+		img = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+		if pix.n == 4:
+			img = img[:, :, :3]
+		return np.ascontiguousarray(img[:, :, ::-1])
+
+	# Convert one prediction into NMS-filtered detection dicts, dropping 'abandon' boxes.
+	# Boxes stay as parallel arrays through NMS; dicts are built only for survivors.
+	def _collectDetections(self, pred):
+		boxes = getattr(pred, 'boxes', None)
+		if boxes is None or len(boxes) == 0:
+			return []
+		names = pred.names
+		classIds = boxes.cls.cpu().numpy().astype(np.int32)
+		scores = boxes.conf.cpu().numpy()
+		bboxes = boxes.xyxy.cpu().numpy()
+
+		abandonIds = [classId for classId, name in names.items() if name == 'abandon']
+		valid = ~np.isin(classIds, abandonIds)
+		classIds, scores, bboxes = classIds[valid], scores[valid], bboxes[valid]
+
+		keep = self.nms.suppress(bboxes, scores, classIds, iouThreshold=self.iouThreshold)
+		return [
+			{'class_name': names[int(classId)], 'bbox': bbox, 'conf': float(score)}
+			for classId, bbox, score in zip(classIds[keep], bboxes[keep].tolist(), scores[keep])
+		]
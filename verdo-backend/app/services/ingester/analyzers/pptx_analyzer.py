@@ -13,8 +13,11 @@ class PptxAnalyzer:
 		results = []
 		for slideNum, slide in enumerate(prs.slides):
 			elements = []
+			slideTypes = self.shapeClassifier.classifySlide(slide)
 			for shape in slide.shapes:
-				elemType = self.shapeClassifier.classifyShape(shape)
+				elemType = slideTypes.get(shape.shape_id)
+				if elemType is None:
+					elemType = self.shapeClassifier.classifyShape(shape)
 				element = {
 					'slide_number': slideNum + 1,
 					'raw_type': shape.shape_type,
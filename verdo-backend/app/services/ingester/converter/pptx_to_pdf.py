@@ -1,8 +1,20 @@
+import atexit
 import os
 import subprocess
 import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
+
+try:
+	from unoserver.client import UnoClient  # type: ignore
+except Exception:
+	UnoClient = None
+
+UNO_HOST = "127.0.0.1"
+UNO_PORT = "2003"
+UNO_STARTUP_TIMEOUT = 30.0  # seconds to wait for a freshly spawned server
 
 # --- Classes ------------------------------------------------------------
 
@@ -10,10 +22,16 @@ class PptxToPdfConverter:
 	# Converts PPTX files to PDF via pluggable engines.
 	# Engines supported:
 	# - PowerPoint (Windows Office automation)
-	# - LibreOffice (headless soffice)
+	# - LibreOffice (long-lived unoserver when installed, else one-shot headless soffice)
+	# The unoserver listens on the fixed UNO_PORT, so there is one per process, shared
+	# by every instance and stopped at exit.
+
+	unoProcess: Optional[subprocess.Popen] = None
+	unoLock = threading.Lock()
 
-	def __init__(self, prefer: str = "auto") -> None:
+	def __init__(self, prefer: str = "auto", persistent: bool = True) -> None:
 		self.prefer = prefer  # 'auto' | 'powerpoint' | 'libreoffice'
+		self.persistent = persistent and UnoClient is not None
 
 	def convert(self, pptxPath: str, outDir: Optional[str] = None) -> str:
 		src = Path(pptxPath)
@@ -48,6 +66,41 @@ class PptxToPdfConverter:
 			raise RuntimeError(err or "Conversion failed")
 		return str(dst)
 
+	# Converts several PPTX files with a single soffice start-up; returns PDF paths
+	def convertMany(self, pptxPaths: List[str], outDir: Optional[str] = None) -> List[str]:
+		outRoot = Path(outDir) if outDir else Path(tempfile.gettempdir())
+		outRoot.mkdir(parents=True, exist_ok=True)
+		sources = [Path(p) for p in pptxPaths]
+		missing = [str(src) for src in sources if not src.exists()]
+		if missing:
+			raise RuntimeError(f"Source not found: {missing[0]}")
+
+		targets = [outRoot / (src.stem + ".pdf") for src in sources]
+		stale = [
+			str(src) for src, dst in zip(sources, targets)
+			if not (dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime)
+		]
+		if stale:
+			self._runSoffice(stale, str(outRoot))
+
+		failed = [str(dst) for dst in targets if not dst.exists()]
+		if failed:
+			raise RuntimeError(f"LibreOffice export failed for: {', '.join(failed)}")
+		return [str(dst) for dst in targets]
+
+	# Stops the shared background unoserver, if one was started
+	@classmethod
+	def close(cls) -> None:
+		with cls.unoLock:
+			proc, cls.unoProcess = cls.unoProcess, None
+		if proc is None or proc.poll() is not None:
+			return
+		proc.terminate()
+		try:
+			proc.wait(timeout=10)
+		except subprocess.TimeoutExpired:
+			proc.kill()
+
 	def _chooseEngine(self) -> str:
 		if self.prefer in ("powerpoint", "libreoffice"):
 			return self.prefer
@@ -71,7 +124,17 @@ class PptxToPdfConverter:
 			raise RuntimeError(f"win32com not available: {e}")
 
 		powerpoint = win32com.client.Dispatch("PowerPoint.Application")
-		powerpoint.Visible = 1
+		# Stay hidden so PowerPoint skips UI/thumbnail rendering; some Office builds
+		# refuse to hide the application window, in which case keep it visible.
+		try:
+			powerpoint.Visible = 0
+		except Exception:
+			powerpoint.Visible = 1
+		try:
+			powerpoint.DisplayAlerts = 1  # ppAlertsNone
+		except Exception as e:
+			# Export still runs, but a modal dialog can now block it
+			print(f"⚠️  PowerPoint rejected DisplayAlerts=ppAlertsNone, alerts stay on: {e}")
 		try:
 			presentation = powerpoint.Presentations.Open(src, WithWindow=False)
 			# 32 = ppSaveAsPDF
@@ -85,16 +148,56 @@ class PptxToPdfConverter:
 
 	def _convertWithLibreOffice(self, src: str, dst: str) -> None:
 		# Export via headless LibreOffice (cross-platform).
-		outDir = str(Path(dst).parent)
+		# A warm unoserver avoids paying soffice start-up on every file; if it cannot
+		# be reached, fall back to the one-shot command below.
+		if self.persistent:
+			try:
+				self._convertWithUnoServer(src, dst)
+				if Path(dst).exists():
+					return
+			except Exception as e:
+				print(f"⚠️  unoserver conversion failed for {src}, falling back to soffice: {e}")
+		self._runSoffice([src], str(Path(dst).parent))
+
+	def _convertWithUnoServer(self, src: str, dst: str) -> None:
+		self._ensureUnoServer()
+		client = UnoClient(server=UNO_HOST, port=UNO_PORT)
+		deadline = time.monotonic() + UNO_STARTUP_TIMEOUT
+		while True:
+			try:
+				client.convert(inpath=src, outpath=dst, convert_to="pdf")
+				return
+			except ConnectionError:
+				# Server still starting (or died); give up once the window closes
+				proc = PptxToPdfConverter.unoProcess
+				if time.monotonic() > deadline or proc is None or proc.poll() is not None:
+					raise
+				time.sleep(0.5)
+
+	def _ensureUnoServer(self) -> None:
+		with PptxToPdfConverter.unoLock:
+			proc = PptxToPdfConverter.unoProcess
+			if proc is not None and proc.poll() is None:
+				return
+			PptxToPdfConverter.unoProcess = subprocess.Popen(
+				["unoserver", "--interface", UNO_HOST, "--port", UNO_PORT],
+				stdout=subprocess.DEVNULL,
+				stderr=subprocess.DEVNULL,
+			)
+
+	def _runSoffice(self, sources: List[str], outDir: str) -> None:
 		cmd = [
 			"soffice",
 			"--headless",
 			"--convert-to",
 			"pdf",
-			src,
+			*sources,
 			"--outdir",
 			outDir,
 		]
 		proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
 		if proc.returncode != 0:
 			raise RuntimeError(proc.stderr or proc.stdout or "LibreOffice failed")
+
+
+atexit.register(PptxToPdfConverter.close)
@@ -1,8 +1,12 @@
 import os
+import threading
+from functools import lru_cache
 
 from doclayout_yolo import YOLOv10
 from huggingface_hub import snapshot_download
 
+_loadLock = threading.Lock()  # serialize first-use download/load
+
 # --- Classes ------------------------------------------------------------
 
 class ModelLoader:
@@ -10,9 +14,18 @@ class ModelLoader:
 		self.repoId = repoId
 		self.localDir = localDir
 
+	# Returns the process-wide model instance for this repo/dir (loaded once)
 	def load(self):
-		modelDir = snapshot_download(repo_id=self.repoId, local_dir=self.localDir)
-		weights = next((os.path.join(modelDir, f) for f in os.listdir(modelDir) if f.endswith(".pt")), None)
-		if not weights:
-			raise FileNotFoundError("No .pt weights found in model directory.")
-		return YOLOv10(weights)
+		with _loadLock:
+			return _loadCached(self.repoId, self.localDir)
+
+
+# --- Helpers ------------------------------------------------------------
+
+@lru_cache(maxsize=None)
+def _loadCached(repoId, localDir):
+	modelDir = snapshot_download(repo_id=repoId, local_dir=localDir)
+	weights = next((os.path.join(modelDir, f) for f in os.listdir(modelDir) if f.endswith(".pt")), None)
+	if not weights:
+		raise FileNotFoundError("No .pt weights found in model directory.")
+	return YOLOv10(weights)
@@ -1,3 +1,12 @@
+import numpy as np
+
+try:
+	from numba import njit
+except Exception:
+	njit = None
+
+SMALL_GROUP_SIZE = 16  # below this, scalar IoU beats building the NxN matrices
+
 # --- Classes ------------------------------------------------------------
 
 class NmsProcessor:
@@ -15,18 +24,105 @@ class NmsProcessor:
 		box2Area = (x2Max - x2Min) * (y2Max - y2Min)
 		return interArea / (box1Area + box2Area - interArea)
 
+	# Pairwise intersection and union areas for an (N, 4) array of xyxy boxes
+	@staticmethod
+	def computeInterUnion(boxes: np.ndarray):
+		topLeft = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+		bottomRight = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+		inter = np.prod(np.clip(bottomRight - topLeft, 0, None), axis=2)
+		area = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+		union = area[:, None] + area[None, :] - inter
+		return inter, union
+
 	# Remove overlapping detections (same class + IoU > threshold)
+	# fast=True uses Fast NMS (YOLACT): a box is dropped if any higher-scored box
+	# of its class overlaps it, even one that was itself suppressed.
 	@staticmethod
-	def removeDuplicates(detections, iouThreshold=0.7):
+	def removeDuplicates(detections, iouThreshold=0.7, fast=True):
 		if not detections: return []
 		detections.sort(key=lambda x: x['conf'], reverse=True)
+
+		classIds = {}
+		keep = NmsProcessor.suppress(
+			np.asarray([d['bbox'] for d in detections], dtype=np.float32),
+			np.asarray([d['conf'] for d in detections], dtype=np.float32),
+			np.asarray([classIds.setdefault(d['class_name'], len(classIds)) for d in detections]),
+			iouThreshold=iouThreshold,
+			fast=fast,
+		)
+		return [detections[i] for i in keep]
+
+	# Array NMS over (N, 4) boxes, (N,) scores and (N,) class ids.
+	# Returns kept indices in descending score order.
+	@staticmethod
+	def suppress(boxes, scores, classIds, iouThreshold=0.7, fast=True) -> np.ndarray:
+		order = np.argsort(-scores, kind='stable')
+		keptMask = np.zeros(len(order), dtype=bool)
+
+		# Suppression only happens within a class, so run NMS per class
+		orderedClasses = classIds[order]
+		for classId in np.unique(orderedClasses):
+			members = order[orderedClasses == classId]  # score-sorted indices of this class
+			groupBoxes = boxes[members]
+			if len(members) < SMALL_GROUP_SIZE:
+				keptMask[members] = NmsProcessor._suppressSmallGroup(groupBoxes, iouThreshold, fast)
+			else:
+				keptMask[members] = NmsProcessor._suppressLargeGroup(groupBoxes, iouThreshold, fast)
+
+		return order[keptMask[order]]
+
+	# Matrix NMS for one class; boxes sorted by score, returns a keep mask
+	@staticmethod
+	def _suppressLargeGroup(boxes, iouThreshold, fast):
+		inter, union = NmsProcessor.computeInterUnion(boxes)
+		overlaps = inter > iouThreshold * union  # IoU > threshold without the division
+		if fast:
+			return ~np.triu(overlaps, k=1).any(axis=0)
+
+		suppressed = np.zeros(len(boxes), dtype=bool)
+		keep = np.zeros(len(boxes), dtype=bool)
+		for i in range(len(boxes)):
+			if suppressed[i]:
+				continue
+			keep[i] = True
+			suppressed |= overlaps[i]
+		return keep
+
+	# Pairwise scalar NMS for a handful of same-class boxes sorted by score
+	@staticmethod
+	def _suppressSmallGroup(boxes, iouThreshold, fast):
+		boxes = [tuple(box) for box in boxes.tolist()]
 		keep = []
-		while detections:
-			best = detections.pop(0)
-			keep.append(best)
-			detections = [
-				d for d in detections
-				if d['class_name'] != best['class_name'] or
-				NmsProcessor.computeIou(d['bbox'], best['bbox']) <= iouThreshold
-			]
+		keptBoxes = []
+		for idx, box in enumerate(boxes):
+			# Fast NMS compares against every higher-scored box, greedy only against kept ones
+			rivals = boxes[:idx] if fast else keptBoxes
+			x1, y1, x2, y2 = box
+			overlapped = any(
+				_iouScalar(rx1, ry1, rx2, ry2, x1, y1, x2, y2) > iouThreshold
+				for rx1, ry1, rx2, ry2 in rivals
+			)
+			keep.append(not overlapped)
+			if not overlapped:
+				keptBoxes.append(box)
 		return keep
+
+
+# --- Helpers ------------------------------------------------------------
+
+# Scalar IoU on unpacked coordinates (JIT-compiled when numba is available)
+def _iouScalar(ax1, ay1, ax2, ay2, bx1, by1, bx2, by2):
+	interW = min(ax2, bx2) - max(ax1, bx1)
+	interH = min(ay2, by2) - max(ay1, by1)
+	if interW <= 0.0 or interH <= 0.0:
+		return 0.0
+	inter = interW * interH
+	union = (ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter
+	if union <= 0.0:
+		return 0.0
+	return inter / union
+
+
+if njit is not None:
+	_iouScalar = njit(cache=True, fastmath=True)(_iouScalar)
+	_iouScalar(0.0, 0.0, 1.0, 1.0, 0.0, 0.0, 1.0, 1.0)  # compile at import, not on first page
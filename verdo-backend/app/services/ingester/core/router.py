@@ -1,6 +1,8 @@
 import os
 import uuid
 
+import fitz
+
 from app.services.ingester.analyzers.pdf_analyzer import PdfAnalyzer
 from app.services.ingester.analyzers.pptx_analyzer import PptxAnalyzer
 from app.services.ingester.converter.pptx_to_pdf import PptxToPdfConverter
@@ -53,15 +55,7 @@ class Router:
 
 				# Process the converted PDF
 				try:
-					analyzed = self.analyzers[".pdf"].analyze(pdfPath, maxPages=maxPages)
-					extracted = self.extractor.extract(pdfPath, analyzed)
-					
-					# Assign unique IDs to all elements
-					for page in extracted:
-						for element in page.get('elements', []):
-							element['id'] = str(uuid.uuid4())
-							
-					return extracted
+					return self._processPdf(pdfPath, maxPages=maxPages)
 				finally:
 					# Clean up temporary PDF
 					if os.path.exists(pdfPath):
@@ -77,11 +71,19 @@ class Router:
 				raise RuntimeError(f"PPTX conversion failed: {e}")
 
 		# Handle PDF files directly
-		# Step 1: Analyze (detect elements)
-		analyzed = self.analyzers[ext].analyze(filePath, maxPages=maxPages)
-
-		# Step 2: Extract (process elements with handlers)
-		extracted = self.extractor.extract(filePath, analyzed)
+		return self._processPdf(filePath, maxPages=maxPages)
+
+	# Analyze + extract a PDF, parsing the document once for both stages
+	def _processPdf(self, pdfPath: str, maxPages: int = None):
+		doc = fitz.open(pdfPath)
+		try:
+			# Step 1: Analyze (detect elements)
+			analyzed = self.analyzers[".pdf"].analyze(pdfPath, maxPages=maxPages, doc=doc)
+
+			# Step 2: Extract (process elements with handlers)
+			extracted = self.extractor.extract(pdfPath, analyzed, doc=doc)
+		finally:
+			doc.close()
 
 		# Assign unique IDs to all elements
 		for page in extracted:
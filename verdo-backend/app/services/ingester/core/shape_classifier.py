@@ -1,11 +1,57 @@
+from lxml import etree
 from pptx.enum.shapes import MSO_SHAPE_TYPE
 
+MATH_NS = {"m": "http://schemas.openxmlformats.org/officeDocument/2006/math"}
+PRESENTATION_NS = {"p": "http://schemas.openxmlformats.org/presentationml/2006/main"}
+
+# Compiled once; lxml would otherwise re-parse the expression on every call
+OMML_XPATH = etree.XPath('.//m:oMath | .//m:oMathPara', namespaces=MATH_NS)
+OLE_XPATH = etree.XPath('.//p:oleObj', namespaces=PRESENTATION_NS)
+
+# Slide-wide variants: ids (cNvPr/@id) of top-level shapes that contain OMML / OLE
+SLIDE_OMML_IDS_XPATH = etree.XPath(
+	'./p:cSld/p:spTree/*[.//m:oMath or .//m:oMathPara]/*[1]/p:cNvPr/@id',
+	namespaces={**MATH_NS, **PRESENTATION_NS},
+)
+SLIDE_OLE_IDS_XPATH = etree.XPath(
+	'./p:cSld/p:spTree/*[.//p:oleObj]/*[1]/p:cNvPr/@id',
+	namespaces=PRESENTATION_NS,
+)
+
 # --- Classes ------------------------------------------------------------
 
 class ShapeClassifier:
+	# Classify every shape on a slide; returns {shape_id: type}.
+	# OMML/OLE presence comes from one xpath pass over the slide XML,
+	# so no per-shape XML probing is needed.
+	@staticmethod
+	def classifySlide(slide):
+		shapes = list(slide.shapes)
+		shapeIds = [shape.shape_id for shape in shapes]
+		if len(set(shapeIds)) != len(shapeIds):
+			# Duplicate ids (malformed deck): ids can't key the slide scan
+			return {}
+
+		try:
+			slideEl = slide._element
+			ommlIds = {int(v) for v in SLIDE_OMML_IDS_XPATH(slideEl)}
+			oleIds = {int(v) for v in SLIDE_OLE_IDS_XPATH(slideEl)}
+		except Exception:
+			return {}
+
+		return {
+			shape.shape_id: ShapeClassifier.classifyShape(
+				shape,
+				hasOmml=shape.shape_id in ommlIds,
+				hasOle=shape.shape_id in oleIds,
+			)
+			for shape in shapes
+		}
+
 	# Classify PowerPoint shapes into text, image, table, etc.
+	# hasOmml/hasOle: precomputed XML facts (from classifySlide); probed when None
 	@staticmethod
-	def classifyShape(shape):
+	def classifyShape(shape, hasOmml=None, hasOle=None):
 		t = shape.shape_type
 		if t == MSO_SHAPE_TYPE.PICTURE: return 'image'
 		if t == MSO_SHAPE_TYPE.TABLE: return 'table'
@@ -13,78 +59,77 @@ class ShapeClassifier:
 		# Math can be either an embedded OLE object (MathType/legacy)
 		# or inline OMML within a text box/run. Detect both.
 		if t == MSO_SHAPE_TYPE.EMBEDDED_OLE_OBJECT: return 'equation'
-		try:
-			if ShapeClassifier._hasOmml(shape):
+		# OMML only lives in text bodies (directly or inside groups), so skip XML work
+		# for everything else and probe at most once per shape.
+		if ShapeClassifier._mayHoldOmml(shape, t):
+			if hasOmml is None:
+				hasOmml = ShapeClassifier._safeHasOmml(shape)
+			if hasOmml:
 				return 'equation'
-		except Exception:
-			pass
 		if t == 15: return 'diagram'
 		if t == MSO_SHAPE_TYPE.GROUP:
-			# Groups can wrap OLE/OMML children; treat as equation if present
-			try:
-				if ShapeClassifier._hasOmml(shape) or ShapeClassifier._hasOle(shape):
-					return 'equation'
-			except Exception:
-				pass
+			# Groups can wrap OLE children; treat as equation if present
+			if hasOle is None:
+				try:
+					hasOle = ShapeClassifier._hasOle(shape)
+				except Exception:
+					hasOle = False
+			if hasOle:
+				return 'equation'
 			return 'group'
 		if t == 17: return 'text'
 		if t == MSO_SHAPE_TYPE.PLACEHOLDER:
 			try:
 				_ = shape.image; return 'image'
 			except AttributeError: pass
-			# If placeholder contains OMML, treat it as equation
-			try:
-				if ShapeClassifier._hasOmml(shape):
-					return 'equation'
-			except Exception:
-				pass
 			if shape.has_text_frame and shape.text.strip(): return 'text'
 			return 'unknown'
-		# Text fallback (but prefer equation if OMML is present)
+		# Text fallback (OMML was already ruled out above)
 		if hasattr(shape, 'has_text_frame') and shape.has_text_frame:
-			try:
-				if ShapeClassifier._hasOmml(shape):
-					return 'equation'
-			except Exception:
-				pass
 			return 'text'
 		return 'unknown'
 
+	@staticmethod
+	def _mayHoldOmml(shape, shapeType) -> bool:
+		if shapeType in (MSO_SHAPE_TYPE.GROUP, MSO_SHAPE_TYPE.PLACEHOLDER):
+			return True
+		return bool(getattr(shape, 'has_text_frame', False))
+
+	@staticmethod
+	def _safeHasOmml(shape) -> bool:
+		try:
+			return ShapeClassifier._hasOmml(shape)
+		except Exception:
+			return False
+
 	@staticmethod
 	def _hasOmml(shape) -> bool:
 		# Lightweight check for OMML in a shape.
-		# Looks for oMath/oMathPara elements via xpath if available,
-		# otherwise searches the element XML string.
+		# Looks for oMath/oMathPara elements via compiled xpath if available,
+		# otherwise queries the text body, then searches the element XML string.
 		el = getattr(shape, '_element', None)
 		if el is None:
 			el = getattr(shape, 'element', None)
 		if el is None:
 			return False
-		# Preferred: xpath lookup
+		# Preferred: xpath over the whole element. It reaches the text body and group
+		# children, so a clean miss is final and no XML has to be serialized.
 		if hasattr(el, 'xpath'):
 			try:
-				ns = {"m": "http://schemas.openxmlformats.org/officeDocument/2006/math"}
-				nodes = el.xpath('.//m:oMath | .//m:oMathPara', namespaces=ns)
-				if nodes:
-					return True
+				return bool(OMML_XPATH(el))
 			except Exception:
 				pass
-		# Fallback: string search on XML
+		# Fallback: one xpath over the text body instead of walking runs
+		try:
+			txBody = getattr(getattr(shape, 'text_frame', None), '_txBody', None)
+			if txBody is not None and OMML_XPATH(txBody):
+				return True
+		except Exception:
+			pass
+		# Last resort: string search on XML
 		xml = getattr(el, 'xml', None)
-		if isinstance(xml, str) and ('oMath' in xml or 'oMathPara' in xml):
+		if isinstance(xml, str) and 'oMath' in xml:
 			return True
-		# Last resort: scan text runs for embedded OMML fragments
-		tf = getattr(shape, 'text_frame', None)
-		if tf is not None:
-			try:
-				for p in tf.paragraphs:
-					for r in p.runs:
-						rx = getattr(r, '_r', None)
-						rxml = getattr(rx, 'xml', None)
-						if isinstance(rxml, str) and ('oMath' in rxml or 'oMathPara' in rxml):
-							return True
-			except Exception:
-				pass
 		return False
 
 	@staticmethod
@@ -97,9 +142,7 @@ class ShapeClassifier:
 			return False
 		if hasattr(el, 'xpath'):
 			try:
-				ns = {"p": "http://schemas.openxmlformats.org/presentationml/2006/main"}
-				nodes = el.xpath('.//p:oleObj', namespaces=ns)
-				if nodes:
+				if OLE_XPATH(el):
 					return True
 			except Exception:
 				pass
@@ -1,3 +1,6 @@
+import threading
+from concurrent.futures import wait
+
 import fitz  # PyMuPDF
 from pptx import Presentation
 
@@ -7,28 +10,37 @@ from app.services.ingester.handlers.image_handler import ImageHandler
 from app.services.ingester.handlers.table_handler import TableHandler
 from app.services.ingester.handlers.text_handler import TextHandler
 
+PDF_IMAGE_TYPES = frozenset(('image', 'figure'))
+IMAGE_SETTLE_TIMEOUT = 60.0  # seconds to let in-flight renders finish after a failure
+
 # --- Classes ------------------------------------------------------------
 
 class ContentExtractor:
 	# Routes analyzed elements to their correct handlers.
 
-	def __init__(self, verbose=True, apiKey=None, llmClient=None, enableCache=True):
+	# batchImages: queue image descriptions and send them as one Batch API job per document
+	def __init__(self, verbose=True, apiKey=None, llmClient=None, enableCache=True, batchImages=False):
 		# Verbose: Whether to print processing messages
 		self.verbose = verbose
 		self.llm = llmClient
-		self.textHandler = TextHandler()
+		# Image crops render on LLM worker threads; PyMuPDF isn't thread-safe, so all
+		# handlers (and this extractor) take this lock around fitz calls
+		self.renderLock = threading.Lock()
+		self.textHandler = TextHandler(renderLock=self.renderLock)
 		
 		# Initialize dependencies first
 		self.tableHandler = TableHandler(
 			apiKey=apiKey,
 			llmClient=llmClient,
 			enableGptFallback=True,
-			verbose=verbose
+			verbose=verbose,
+			renderLock=self.renderLock
 		)
 		self.formulaHandler = FormulaHandler(
 			apiKey=apiKey,
 			llmClient=llmClient,
-			verbose=verbose
+			verbose=verbose,
+			renderLock=self.renderLock
 		)
 		
 		# Helper for Image Handler (avoid circular dep by passing instances)
@@ -38,19 +50,26 @@ class ContentExtractor:
 			enableCache=enableCache,
 			verbose=verbose,
 			tableHandler=self.tableHandler,
-			formulaHandler=self.formulaHandler
+			formulaHandler=self.formulaHandler,
+			batchMode=batchImages,
+			renderLock=self.renderLock
 		)
 
 		self.defaultHandler = DefaultHandler()
+		self._handlerMap = self._buildHandlerMap()
+
+		# Cap outstanding image tasks so huge documents don't queue every crop at once
+		maxWorkers = getattr(llmClient, 'maxWorkers', 0) or 0
+		self._inflight = threading.BoundedSemaphore(max(2 * maxWorkers, 64))
 
 	# ===== Universal Entry Point =====
 
-	# Extract content from analyzed elements
-	def extract(self, filePath, analyzedElements):
+	# Extract content from analyzed elements (doc: optional open fitz.Document for PDFs)
+	def extract(self, filePath, analyzedElements, doc=None):
 		if filePath.endswith(".pptx"):
 			return self.extractFromPptx(filePath, analyzedElements)
 		elif filePath.endswith(".pdf"):
-			return self.extractFromPdf(filePath, analyzedElements)
+			return self.extractFromPdf(filePath, analyzedElements, doc=doc)
 		else:
 			raise ValueError(f"Unsupported file type: {filePath}")
 
@@ -61,17 +80,24 @@ class ContentExtractor:
 		prs = Presentation(filePath)
 
 		# First pass: submit all image processing tasks and collect futures
-		imageFutures = []  # List of (slideNum, elemIndex, future)
+		imageFutures = []  # List of (elemData, future)
 		elementsMetadata = []  # List of (slideNum, elemList)
 
+		# Hoisted lookups for the per-element loop
+		handlerMap = self._handlerMap
+		defaultHandler = self.defaultHandler
+		submitImage = self._submitImageTask
+		handlePptxAsync = getattr(self.imageHandler, 'handlePptxAsync', None)
+
 		for slideData in analyzedElements:
 			slideNum = slideData['slide_number']
 			slide = prs.slides[slideNum - 1]
+			shapeIndex = self._indexShapes(slide)
 			slideElements = []
 
-			for elemIndex, elem in enumerate(slideData['elements']):
+			for elem in slideData['elements']:
 				elemType = elem['classified_type']
-				shape = self._findShape(slide, elem['position'])
+				shape = self._lookupShape(shapeIndex, elem['position'], elem['size'])
 
 				if shape is None:
 					if self.verbose:
@@ -85,15 +111,15 @@ class ContentExtractor:
 					'size': elem['size'],
 					'content': None,  # Will be filled later
 					'shape': shape,
-					'handler': self._getHandler(elemType)
+					'handler': handlerMap.get(elemType, defaultHandler)
 				}
 				slideElements.append(elemData)
 
 				# For images, submit async task immediately
-				if elemType == 'image' and hasattr(self.imageHandler, 'handlePptxAsync'):
+				if elemType == 'image' and handlePptxAsync is not None:
 					try:
-						future = self.imageHandler.handlePptxAsync(shape)
-						imageFutures.append((slideNum, len(slideElements) - 1, future))
+						future = submitImage(handlePptxAsync, shape)
+						self._trackImageFuture(imageFutures, elemData, future)
 					except Exception as e:
 						if self.verbose:
 							print(f"⚠️  Error submitting image task: {e}")
@@ -117,50 +143,71 @@ class ContentExtractor:
 						content = handler.handle()
 					elemData['content'] = content
 
-		# Third pass: wait for all image futures to complete
-		for slideNum, elemIndex, future in imageFutures:
-			# Find the corresponding element
-			for sNum, slideElements in elementsMetadata:
-				if sNum == slideNum:
-					slideElements[elemIndex]['content'] = future.result()
-					break
+		# Third pass: send any batched images, then wait for the remaining image futures
+		# (also surfaces failures)
+		self._flushImageBatch()
+		for elemData, future in imageFutures:
+			elemData['content'] = future.result()
 
 		# Build final results
-		results = []
-		for slideNum, slideElements in elementsMetadata:
-			extracted = []
-			for elemData in slideElements:
-				extracted.append({
-					'type': elemData['type'],
-					'position': elemData['position'],
-					'size': elemData['size'],
-					'content': elemData['content']
-				})
-			results.append({'slide_number': slideNum, 'elements': extracted})
-
-		return results
+		return [
+			{
+				'slide_number': slideNum,
+				'elements': [
+					{
+						'type': elemData['type'],
+						'position': elemData['position'],
+						'size': elemData['size'],
+						'content': elemData['content']
+					}
+					for elemData in slideElements
+				],
+			}
+			for slideNum, slideElements in elementsMetadata
+		]
 
 	# ===== PDF Extraction =====
 
 	# Extract content from PDF pages with parallel image processing
-	def extractFromPdf(self, filePath, analyzedElements, dpi=250):
-		doc = fitz.open(filePath)
-
+	def extractFromPdf(self, filePath, analyzedElements, dpi=250, doc=None):
+		ownsDoc = doc is None
+		if ownsDoc:
+			doc = fitz.open(filePath)
+		try:
+			return self._extractPdfPages(doc, analyzedElements, dpi)
+		finally:
+			# Release the pdfplumber handles opened for this document's tables, even
+			# when an element failed
+			self.tableHandler.close()
+			if ownsDoc:
+				doc.close()
+
+	# Passes 1-3 of extractFromPdf over an open document
+	def _extractPdfPages(self, doc, analyzedElements, dpi):
 		# First pass: submit all image processing tasks and collect futures
-		imageFutures = []  # List of (pageNum, detIndex, future)
+		imageFutures = []  # List of (elemData, future)
 		elementsMetadata = []  # List of (pageNum, detList)
 
+		# Hoisted lookups for the per-detection loop
+		handlerMap = self._handlerMap
+		defaultHandler = self.defaultHandler
+		submitImage = self._submitImageTask
+		handlePdfAsync = getattr(self.imageHandler, 'handlePdfAsync', None)
+
 		for pageData in analyzedElements:
 			pageNum = pageData['page_number']
-			page = doc[pageNum - 1]
+			with self.renderLock:
+				page = doc[pageNum - 1]
+				pageRect = page.rect
 
 			# Calculate scale factor between YOLO and PDF coordinates
-			detectionW = int(page.rect.width * dpi / 72)
-			detectionH = int(page.rect.height * dpi / 72)
-			scale = ((page.rect.width / detectionW) + (page.rect.height / detectionH)) / 2
+			pageW, pageH = pageRect.width, pageRect.height
+			detectionW = int(pageW * dpi / 72)
+			detectionH = int(pageH * dpi / 72)
+			scale = ((pageW / detectionW) + (pageH / detectionH)) / 2
 
 			pageElements = []
-			for detIndex, det in enumerate(pageData['detections']):
+			for det in pageData['detections']:
 				cls, bbox, conf = det['class_name'], det['bbox'], det['conf']
 
 				# Store element metadata
@@ -169,62 +216,117 @@ class ContentExtractor:
 					'bbox': bbox,
 					'confidence': conf,
 					'content': None,  # Will be filled later
-					'handler': self._getHandler(cls),
+					'handler': handlerMap.get(cls, defaultHandler),
 					'page': page,
 					'scale': scale
 				}
 				pageElements.append(elemData)
 
 				# For images/figures, submit async task immediately
-				if cls in ['image', 'figure'] and hasattr(self.imageHandler, 'handlePdfAsync'):
+				if cls in PDF_IMAGE_TYPES and handlePdfAsync is not None:
 					try:
-						future = self.imageHandler.handlePdfAsync(page, bbox, scale)
-						imageFutures.append((pageNum, len(pageElements) - 1, future))
+						future = submitImage(handlePdfAsync, page, bbox, scale)
+						self._trackImageFuture(imageFutures, elemData, future)
 					except Exception as e:
 						if self.verbose:
 							print(f"⚠️  Error submitting image task: {e}")
 
 			elementsMetadata.append((pageNum, pageElements))
 
-		# Second pass: process non-image elements
-		for pageNum, pageElements in elementsMetadata:
-			for elemData in pageElements:
-				if elemData['type'] not in ['image', 'figure']:
-					handler = elemData['handler']
-					try:
-						content = handler.handlePdf(elemData['page'], elemData['bbox'], elemData['scale'])
-					except AttributeError:
-						# Handler doesn't implement handlePdf (e.g., DefaultHandler)
-						content = handler.handle()
-					elemData['content'] = content
-
-		# Third pass: wait for all image futures to complete
-		for pageNum, detIndex, future in imageFutures:
-			# Find the corresponding element
-			for pNum, pageElements in elementsMetadata:
-				if pNum == pageNum:
-					pageElements[detIndex]['content'] = future.result()
-					break
+		try:
+			# Second pass: process non-image elements
+			for pageNum, pageElements in elementsMetadata:
+				for elemData in pageElements:
+					if elemData['type'] not in PDF_IMAGE_TYPES:
+						handler = elemData['handler']
+						try:
+							content = handler.handlePdf(
+								elemData['page'], elemData['bbox'], elemData['scale'],
+							)
+						except AttributeError:
+							# Handler doesn't implement handlePdf (e.g., DefaultHandler)
+							content = handler.handle()
+						elemData['content'] = content
+
+			# Third pass: send any batched images, then wait for the remaining image futures
+			# (also surfaces failures)
+			self._flushImageBatch()
+			for elemData, future in imageFutures:
+				elemData['content'] = future.result()
+		except Exception:
+			# In-flight renders still read the document: let them settle before it closes
+			wait([future for _, future in imageFutures], timeout=IMAGE_SETTLE_TIMEOUT)
+			raise
 
 		# Build final results
-		results = []
-		for pageNum, pageElements in elementsMetadata:
-			extracted = []
-			for elemData in pageElements:
-				extracted.append({
-					'type': elemData['type'],
-					'bbox': elemData['bbox'],
-					'confidence': elemData['confidence'],
-					'content': elemData['content']
-				})
-			results.append({'page_number': pageNum, 'elements': extracted})
-
-		doc.close()
+		results = [
+			{
+				'page_number': pageNum,
+				'elements': [
+					{
+						'type': elemData['type'],
+						'bbox': elemData['bbox'],
+						'confidence': elemData['confidence'],
+						'content': elemData['content']
+					}
+					for elemData in pageElements
+				],
+			}
+			for pageNum, pageElements in elementsMetadata
+		]
 		return results
 
 	# ===== Utilities =====
 
-	# Find shape in slide by position
+	# Submit an image task, blocking while too many are already in flight
+	def _submitImageTask(self, submit, *args):
+		if getattr(self.imageHandler, 'batchMode', False):
+			# Batched images only resolve at flush time, so they can't hold a slot
+			return submit(*args)
+		self._inflight.acquire()
+		try:
+			future = submit(*args)
+		except Exception:
+			self._inflight.release()
+			raise
+		future.add_done_callback(lambda _: self._inflight.release())
+		return future
+
+	def _flushImageBatch(self):
+		flushBatch = getattr(self.imageHandler, 'flushBatch', None)
+		if flushBatch is not None:
+			flushBatch()
+
+	# Register an image future; its result is stored on the element as soon as it lands
+	def _trackImageFuture(self, imageFutures, elemData, future):
+		imageFutures.append((elemData, future))
+		future.add_done_callback(lambda done: self._storeImageResult(elemData, done))
+
+	# Done-callback: runs on the worker thread (or inline if already resolved)
+	@staticmethod
+	def _storeImageResult(elemData, future):
+		if not future.cancelled() and future.exception() is None:
+			elemData['content'] = future.result()
+
+	# Index slide shapes by (top, left) once so lookups are O(1) per element
+	def _indexShapes(self, slide):
+		shapeIndex = {}
+		for shape in slide.shapes:
+			shapeIndex.setdefault((shape.top, shape.left), []).append(shape)
+		return shapeIndex
+
+	# Resolve a shape by position, using size to disambiguate stacked shapes
+	def _lookupShape(self, shapeIndex, position, size):
+		candidates = shapeIndex.get(tuple(position))
+		if not candidates:
+			return None
+		if len(candidates) > 1:
+			for shape in candidates:
+				if (shape.width, shape.height) == tuple(size):
+					return shape
+		return candidates[0]
+
+	# Find shape in slide by position (linear scan; prefer _indexShapes/_lookupShape)
 	def _findShape(self, slide, position):
 		top, left = position
 		for shape in slide.shapes:
@@ -234,7 +336,11 @@ class ContentExtractor:
 
 	# Route element type to appropriate handler
 	def _getHandler(self, elemType):
-		handlerMap = {
+		return self._handlerMap.get(elemType, self.defaultHandler)
+
+	# Element type -> handler table, built once per extractor
+	def _buildHandlerMap(self):
+		return {
 			# Text types
 			'text': self.textHandler,
 			'plain text': self.textHandler,
@@ -252,5 +358,3 @@ class ContentExtractor:
 			# 'diagram': self.diagramHandler,
 			# 'group': self.groupHandler,
 		}
-
-		return handlerMap.get(elemType, self.defaultHandler)
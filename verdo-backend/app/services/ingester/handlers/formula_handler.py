@@ -1,14 +1,49 @@
-import base64
-import json
+import os
 import re
+import threading
+from functools import lru_cache
+from pathlib import Path
 from typing import Any, Dict, Optional, Tuple
 
 import fitz  # PyMuPDF
 from lxml import etree
 
+from app.services.ingester.core.shape_classifier import MATH_NS
+from app.services.ingester.handlers.utils import (
+	encodePng,
+	hashImage,
+	pixmapSamples,
+	toDataUrl,
+)
 from app.services.ingester.prompts import (
 	DESCRIBE_FORMULA_PROMPT,
-	EXTRACT_EQUATION_TEXT_PROMPT,
+	EXTRACT_EQUATION_TEXT_TEMPLATE,
+)
+from app.services.ingester.services.utils import loadsJson
+
+# Unicode math symbols -> LaTeX, applied in one regex pass by simpleTextToLatex
+SIMPLE_LATEX_REPLACEMENTS = {
+	"−": "-", "–": "-", "×": "*", "·": "\\cdot ", "÷": "/",
+	"≤": "\\leq ", "≥": "\\geq ", "≠": "\\neq ", "≈": "\\approx ",
+	"→": "\\to ", "←": "\\leftarrow ", "∞": "\\infty ",
+}
+SIMPLE_LATEX_RE = re.compile("|".join(map(re.escape, SIMPLE_LATEX_REPLACEMENTS)))
+# Characters that make text look like an equation
+STRONG_MATH_RE = re.compile("[" + re.escape("=≤≥≈≠^√∑∫/") + "]")
+
+# Outermost OMML nodes: a paragraph wrapper, or a bare oMath outside one
+OMML_ROOTS_XPATH = etree.XPath(
+	'.//m:oMathPara | .//m:oMath[not(ancestor::m:oMathPara)]',
+	namespaces=MATH_NS,
+)
+
+OMML_CACHE_SIZE = 1024  # converted equations kept per handler
+OFFICE_XSL_SUBDIR = Path("Microsoft Office") / "root" / "Office16"
+# Where OMML2MML.XSL is looked up: $OMML2MML_XSL, next to this module, then Office installs
+XSLT_SEARCH_DIRS = (
+	Path(__file__).resolve().parent,
+	Path(os.environ.get("ProgramFiles", r"C:\Program Files")) / OFFICE_XSL_SUBDIR,
+	Path(os.environ.get("ProgramFiles(x86)", r"C:\Program Files (x86)")) / OFFICE_XSL_SUBDIR,
 )
 
 # --- Classes ------------------------------------------------------------
@@ -17,20 +52,45 @@ class FormulaHandler:
 	# Handles formula extraction for PPTX and PDF.
 	# Prioritizes OMML extraction from PPTX, falls back to LLM-based OCR.
 
-	def __init__(self, apiKey: Optional[str] = None, llmClient=None, verbose: bool = True):
+	def __init__(self, apiKey: Optional[str] = None, llmClient=None, verbose: bool = True,
+				 renderLock: Optional[threading.Lock] = None):
 		self.apiKey = apiKey
 		self.llm = llmClient
 		self.verbose = verbose
-		# XSLT for OMML -> MathML
+		self.renderLock = renderLock or threading.Lock()  # shared fitz lock
+		# Successful image extractions by content hash, so repeated images skip the LLM
+		self._resultCache: Dict[str, Dict[str, Any]] = {}
+		# XSLT for OMML -> MathML, compiled once; conversions memoized per OMML string
 		self.omml2mathml = self._loadXslt("OMML2MML.XSL")
+		self._convertOmmlCached = lru_cache(maxsize=OMML_CACHE_SIZE)(self._convertOmml)
 
+	# Compile the stylesheet if it can be found; None disables OMML conversion
 	def _loadXslt(self, filename: str):
+		candidates = [Path(p) for p in (os.environ.get("OMML2MML_XSL"),) if p]
+		candidates += [folder / filename for folder in XSLT_SEARCH_DIRS]
+		for path in candidates:
+			if not path.is_file():
+				continue
+			try:
+				return etree.XSLT(etree.parse(str(path)))
+			except Exception as e:
+				if self.verbose:
+					print(f"  ⚠️  Could not load {path}: {e}")
 		return None
 
-	def handleImage(self, imageBytes: bytes) -> Dict[str, Any]:
+	def handleImage(self, imageBytes: bytes, dataUrl: Optional[str] = None,
+					imageHash: Optional[str] = None) -> Dict[str, Any]:
 		# Extract formula from raw image bytes (delegated from ImageHandler)
+		# dataUrl/imageHash: the caller's already-encoded image and its hash, if known
 		try:
-			return self._extractFormula(imageBytes, source='image_delegation')
+			imageHash = imageHash or hashImage(imageBytes)
+			cached = self._resultCache.get(imageHash)
+			if cached is not None:
+				return dict(cached)
+			result = self._extractFormula(imageBytes, source='image_delegation', dataUrl=dataUrl)
+			if result.get('latex'):
+				self._resultCache[imageHash] = result
+			return dict(result)
 		except Exception as e:
 			if self.verbose:
 				print(f"  ❌ Error extracting formula from image: {e}")
@@ -124,8 +184,9 @@ class FormulaHandler:
 		try:
 			xMin, yMin, xMax, yMax = bbox
 			rect = fitz.Rect(xMin * scale, yMin * scale, xMax * scale, yMax * scale)
-			pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0), clip=rect)
-			imgBytes = pix.tobytes("png")
+			with self.renderLock:
+				samples = pixmapSamples(page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0), clip=rect))
+			imgBytes = encodePng(samples)  # outside the lock
 			if not self.llm:
 				return {'latex': None, 'source': 'ocr_no_llm', 'confidence': 0.0, 'error': None}
 			
@@ -142,12 +203,13 @@ class FormulaHandler:
 				print(f"  ⚠️  PDF math extraction failed: {e}")
 			return {'latex': None, 'source': 'pdf_error', 'confidence': 0.0, 'error': str(e)}
 
+	# First equation in the shape as an OMML string, serializing only that subtree
 	def _extractOmml(self, shape) -> Optional[str]:
 		try:
 			if hasattr(shape, 'element'):
-				xml = shape.element.xml
-				if 'm:oMath' in xml:
-					return xml
+				mathNodes = OMML_ROOTS_XPATH(shape.element)
+				if mathNodes:
+					return etree.tostring(mathNodes[0], encoding='unicode')
 			return None
 		except Exception:
 			return None
@@ -156,14 +218,28 @@ class FormulaHandler:
 		return None
 
 	def _ommlToLatex(self, omml: str) -> Tuple[Optional[str], Optional[str]]:
-		return None, None
+		if self.omml2mathml is None:
+			return None, None
+		return self._convertOmmlCached(omml)
+
+	# OMML -> (latex, mathml). No MathML -> LaTeX step exists yet, so latex stays None.
+	def _convertOmml(self, omml: str) -> Tuple[Optional[str], Optional[str]]:
+		try:
+			mathml = str(self.omml2mathml(etree.fromstring(omml)))
+		except Exception as e:
+			if self.verbose:
+				print(f"  ⚠️  OMML conversion failed: {e}")
+			return None, None
+		return None, mathml or None
 
 	def _normalizeTextEquation(self, text: str) -> str:
 		return text.strip()
 
-	def _extractFormula(self, imageBytes: bytes, source: str = 'ocr') -> Dict[str, Any]:
+	def _extractFormula(self, imageBytes: bytes, source: str = 'ocr',
+						dataUrl: Optional[str] = None) -> Dict[str, Any]:
 		try:
-			imageBase64 = base64.b64encode(imageBytes).decode()
+			if dataUrl is None:
+				dataUrl = toDataUrl(imageBytes)
 			prompt = DESCRIBE_FORMULA_PROMPT
 
 			messages = [
@@ -174,7 +250,7 @@ class FormulaHandler:
 						{
 							"type": "image_url",
 							"image_url": {
-								"url": f"data:image/png;base64,{imageBase64}"
+								"url": dataUrl
 							},
 						},
 					],
@@ -190,7 +266,7 @@ class FormulaHandler:
 			)
 			
 			try:
-				parsed = json.loads(response)
+				parsed = loadsJson(response)
 			except Exception:
 				return {"latex": None, "confidence": 0.0, "error": "json_parse_error"}
 
@@ -213,7 +289,7 @@ class FormulaHandler:
 
 	def _extractFormulaFromText(self, text: str) -> Dict[str, Any]:
 		try:
-			prompt = EXTRACT_EQUATION_TEXT_PROMPT.format(text=text)
+			prompt = EXTRACT_EQUATION_TEXT_TEMPLATE.render(text=text)
 			messages = [{"role": "user", "content": prompt}]
 
 			response = self.llm.chat(
@@ -224,7 +300,7 @@ class FormulaHandler:
 			)
 			
 			try:
-				parsed = json.loads(response)
+				parsed = loadsJson(response)
 			except Exception:
 				latex = None
 			else:
@@ -243,16 +319,9 @@ class FormulaHandler:
 		if not text:
 			return None
 		s = str(text)
-		strong = ("=", "≤", "≥", "≈", "≠", "^", "√", "∑", "∫", "/")
-		if not any(c in s for c in strong):
+		if STRONG_MATH_RE.search(s) is None:
 			return None
-		repl = {
-			"−": "-", "–": "-", "×": "*", "·": "\\cdot ", "÷": "/",
-			"≤": "\\leq ", "≥": "\\geq ", "≠": "\\neq ", "≈": "\\approx ",
-			"→": "\\to ", "←": "\\leftarrow ", "∞": "\\infty ",
-		}
-		for k, v in repl.items():
-			s = s.replace(k, v)
-		
+		s = SIMPLE_LATEX_RE.sub(lambda m: SIMPLE_LATEX_REPLACEMENTS[m.group(0)], s)
+
 		# Greek letters... (kept brief for this update)
 		return s.strip()
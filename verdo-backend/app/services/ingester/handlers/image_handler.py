@@ -1,59 +1,168 @@
-import base64
+import atexit
 import hashlib
 import io
-import json
+import os
+import threading
+from collections import OrderedDict
 from concurrent.futures import Future
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import fitz
+import numpy as np
 from PIL import Image
 
+from app.services.ingester.handlers.utils import (
+	encodePng,
+	encodeSamples,
+	hashImage,
+	pixmapSamples,
+	toDataUrl,
+)
 from app.services.ingester.prompts import (
-	CATEGORIZE_IMAGE_PROMPT,
+	DESCRIBE_AND_CATEGORIZE_PROMPT,
 	DESCRIBE_CHART_PROMPT,
 	DESCRIBE_DIAGRAM_PROMPT,
 	DESCRIBE_FLOWCHART_PROMPT,
 	DESCRIBE_PHOTO_PROMPT,
 	DESCRIBE_TEXT_IMAGE_PROMPT,
 )
+from app.services.ingester.services.utils import (
+	dumpsJson,
+	dumpsJsonBytes,
+	loadsJson,
+)
+
+CACHE_SAVE_DELAY = 2.0  # seconds to coalesce cache writes into one save
+CACHE_MAX_ENTRIES = 10_000  # LRU bound on cached descriptions
+BATCH_TIMEOUT = 30 * 60  # seconds flushBatch waits on the Batch API before going realtime
+PDF_JPEG_QUALITY = 85  # lossy encoding for the first vision call on PDF crops
+DECORATIVE_MIN_PIXELS = 64 * 64  # smaller images (bullets, dividers, icons) skip the LLM
+DECORATIVE_MIN_STD = 5.0  # grayscale std below this is a blank / solid-color image
+DECORATIVE_SAMPLE_SIZE = (256, 256)  # variance is measured on a thumbnail
+DECORATIVE_IMAGE = "<decorative image>"
+VISION_MIME_TYPES = frozenset(("image/png", "image/jpeg", "image/gif", "image/webp"))
+
+# Category labels from DESCRIBE_AND_CATEGORIZE_PROMPT -> canonical kind
+CATEGORY_KINDS = {
+	"technical": "diagram",
+	"chart/graph": "chart",
+	"photo": "photo",
+	"math/formula": "formula",
+	"table": "table",
+	"text-image": "text",
+	"flowchart": "flowchart",
+}
+# Substring fallback for free-form labels, checked in order
+CATEGORY_KEYWORDS = (
+	("table", "table"), ("math", "formula"), ("formula", "formula"),
+	("flowchart", "flowchart"), ("chart", "chart"), ("graph", "chart"),
+	("diagram", "diagram"), ("technical", "diagram"), ("text", "text"),
+)
 
 # --- Classes ------------------------------------------------------------
 
 class ImageCache:
-	# Simple file cache for image descriptions
+	# Simple file cache for image descriptions.
+	# Writes are batched: the first set() after a save arms a saveDelay timer (and an
+	# exit hook), and flush() rewrites the file atomically, then disarms both. With
+	# nothing pending the cache holds no thread or hook, so it can be collected.
+	# Entries are kept in LRU order (oldest first) and capped at maxEntries.
 
-	def __init__(self, cacheDir: str = "./cache/images"):
+	def __init__(self, cacheDir: str = "./cache/images", saveDelay: float = CACHE_SAVE_DELAY,
+				 maxEntries: int = CACHE_MAX_ENTRIES):
 		self.cacheDir = Path(cacheDir)
 		self.cacheDir.mkdir(parents=True, exist_ok=True)
 		self.cacheFile = self.cacheDir / "descriptions.json"
+		self.maxEntries = maxEntries
 		self.cache = self._loadCache()
+		self._evict()
+
+		self.saveDelay = saveDelay
+		self.dirty = False
+		self.cacheLock = threading.Lock()  # guards cache/dirty while snapshotting
+		self.writeLock = threading.Lock()  # one writer of the cache file at a time
+		self.saveTimer: Optional[threading.Timer] = None
 
-	def _loadCache(self) -> Dict[str, str]:
+	def _loadCache(self) -> "OrderedDict[str, str]":
 		if self.cacheFile.exists():
 			try:
-				with open(self.cacheFile, 'r', encoding='utf-8') as f:
-					return json.load(f)
+				with open(self.cacheFile, 'rb') as f:
+					return OrderedDict(loadsJson(f.read()))
 			except Exception:
-				return {}
-		return {}
+				return OrderedDict()
+		return OrderedDict()
 
-	def _saveCache(self) -> None:
+	# Drop least recently used entries beyond maxEntries (caller holds cacheLock after init)
+	def _evict(self) -> None:
+		while len(self.cache) > self.maxEntries:
+			self.cache.popitem(last=False)
+
+	# Write a snapshot to a temp file and swap it in, so readers never see a partial file
+	def _saveCache(self, snapshot: Dict[str, str]) -> None:
+		tmpFile = self.cacheFile.with_name(self.cacheFile.name + ".tmp")
 		try:
-			with open(self.cacheFile, 'w', encoding='utf-8') as f:
-				json.dump(self.cache, f, indent=2, ensure_ascii=False)
-		except Exception:
-			pass
+			with open(tmpFile, 'wb') as f:
+				f.write(dumpsJsonBytes(snapshot))
+			os.replace(tmpFile, self.cacheFile)
+		except Exception as e:
+			print(f"  ERR Error saving image cache: {e}")
+
+	# Mark the cache dirty; the first change after a save schedules the next one
+	# (caller holds cacheLock)
+	def _markDirty(self) -> None:
+		if self.dirty:
+			return
+		self.dirty = True
+		self.saveTimer = threading.Timer(self.saveDelay, self.flush)
+		self.saveTimer.daemon = True
+		self.saveTimer.start()
+		atexit.register(self.flush)
+
+	# Persist pending entries now (also runs from the timer and at interpreter exit)
+	def flush(self) -> None:
+		with self.writeLock:
+			with self.cacheLock:
+				if self.saveTimer is not None:
+					self.saveTimer.cancel()
+					self.saveTimer = None
+				if not self.dirty:
+					return
+				snapshot = dict(self.cache)
+				self.dirty = False
+				atexit.unregister(self.flush)
+			self._saveCache(snapshot)
 
 	def getImageHash(self, imageBytes: bytes) -> str:
-		return hashlib.sha256(imageBytes).hexdigest()
+		return hashImage(imageBytes)
 
 	def get(self, imageHash: str) -> Optional[str]:
-		return self.cache.get(imageHash)
+		with self.cacheLock:
+			description = self.cache.get(imageHash)
+			if description is not None:
+				self.cache.move_to_end(imageHash)
+			return description
+
+	# Look a missed image up under its SHA-256 key (caches written before blake3 or
+	# xxhash was installed) and move a hit to imageHash
+	def migrate(self, imageHash: str, imageBytes: bytes) -> Optional[str]:
+		if ":" not in imageHash:  # already a SHA-256 key
+			return None
+		legacyHash = hashlib.sha256(imageBytes).hexdigest()
+		with self.cacheLock:
+			description = self.cache.pop(legacyHash, None)
+			if description is None:
+				return None
+			self.cache[imageHash] = description
+			self._markDirty()
+		return description
 
 	def set(self, imageHash: str, description: str) -> None:
-		self.cache[imageHash] = description
-		self._saveCache()
+		with self.cacheLock:
+			self.cache[imageHash] = description
+			self.cache.move_to_end(imageHash)
+			self._evict()
+			self._markDirty()
 
 	def stats(self) -> Dict[str, int]:
 		return {
@@ -62,6 +171,21 @@ class ImageCache:
 		}
 
 
+class ImageJob:
+	# One image on its way to a description: the bytes sent to the model, plus what
+	# is needed to finish it (cache key, lossless re-render, result future)
+	__slots__ = ("imageBytes", "mimeType", "context", "renderLossless", "future", "imageHash")
+
+	def __init__(self, imageBytes: bytes, mimeType: str = "image/png", context: Optional[str] = None,
+				 renderLossless: Optional[Callable[[], bytes]] = None, future: Optional[Future] = None):
+		self.imageBytes = imageBytes
+		self.mimeType = mimeType
+		self.context = context
+		self.renderLossless = renderLossless  # () -> PNG bytes, when imageBytes is lossy
+		self.future = future or Future()
+		self.imageHash: Optional[str] = None
+
+
 class ImageHandler:
 	# Handles image extraction, categorization, and description using central LLM
 
@@ -70,7 +194,9 @@ class ImageHandler:
 				 cacheDir: str = "./cache/images",
 				 verbose: bool = True,
 				 tableHandler: Any = None,
-				 formulaHandler: Any = None):
+				 formulaHandler: Any = None,
+				 batchMode: bool = False,
+				 renderLock: Optional[threading.Lock] = None):
 		self.apiKey = apiKey
 		self.llm = llmClient
 		# Use a capable vision model for categorization and description
@@ -78,12 +204,34 @@ class ImageHandler:
 		self.verbose = verbose
 		self.tableHandler = tableHandler
 		self.formulaHandler = formulaHandler
+		# PyMuPDF is not thread-safe: serialize fitz work with the other handlers
+		self.renderLock = renderLock or threading.Lock()
+
+		# Kind -> description prompt; None when a dedicated handler takes the image
+		self._kindPrompts = {
+			"table": None if tableHandler else DESCRIBE_TEXT_IMAGE_PROMPT,
+			"formula": None if formulaHandler else DESCRIBE_TEXT_IMAGE_PROMPT,
+			"chart": DESCRIBE_CHART_PROMPT,
+			"diagram": DESCRIBE_DIAGRAM_PROMPT,
+			"flowchart": DESCRIBE_FLOWCHART_PROMPT,
+			"text": DESCRIBE_TEXT_IMAGE_PROMPT,
+			"photo": DESCRIBE_PHOTO_PROMPT,
+		}
 
 		self.enableCache = enableCache
 		self.cache = ImageCache(cacheDir) if enableCache else None
 
+		# Track API usage (incremented from worker and event-loop threads, so under statsLock)
 		self.apiCallCount = 0
 		self.cacheHitCount = 0
+		self.decorativeCount = 0
+		self.statsLock = threading.Lock()
+
+		# Batch mode: queue cache misses and resolve them all in flushBatch() through
+		# the Batch API (cheaper, but results arrive on the batch's schedule)
+		self.batchMode = batchMode
+		self._pendingBatch: List[ImageJob] = []
+		self._batchLock = threading.Lock()
 
 		if self.cache and self.verbose:
 			stats = self.cache.stats()
@@ -93,8 +241,10 @@ class ImageHandler:
 		# Describe PPTX image asynchronously
 		try:
 			image = shape.image
-			imageBytes = image.blob
-			return self._processImageAsync(imageBytes, context)
+			mimeType = image.content_type if image.content_type in VISION_MIME_TYPES else "image/png"
+			job = ImageJob(image.blob, mimeType, context)
+			self._routeImage(job)
+			return job.future
 		except Exception as e:
 			if self.verbose:
 				print(f"  ERR Error processing PPTX image: {e}")
@@ -108,152 +258,307 @@ class ImageHandler:
 
 	def handlePdfAsync(self, page, bbox, scale: float = 1.0,
 					   context: Optional[str] = None):
-		# Describe PDF region asynchronously
-		try:
-			xMin, yMin, xMax, yMax = bbox
-			rect = fitz.Rect(xMin * scale, yMin * scale, xMax * scale, yMax * scale)
-			pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0), clip=rect)
-			imageBytes = pix.tobytes("png")
-			return self._processImageAsync(imageBytes, context)
-		except Exception as e:
-			if self.verbose:
-				print(f"  ERR Error processing PDF image: {e}")
-			fut = Future()
-			fut.set_result(f"<ERROR: {str(e)}>")
-			return fut
+		# Describe PDF region asynchronously; the crop is rendered on the worker pool.
+		# The vision call gets a JPEG (far smaller for photos); table/formula handlers
+		# get a lossless PNG re-render.
+		xMin, yMin, xMax, yMax = bbox
+		rect = fitz.Rect(xMin * scale, yMin * scale, xMax * scale, yMax * scale)
+
+		# Only the rasterization holds the fitz lock; encoding runs concurrently
+		def render(lossless: bool) -> bytes:
+			with self.renderLock:
+				samples = pixmapSamples(page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0), clip=rect))
+			if lossless:
+				return encodePng(samples)
+			return encodeSamples(samples, "JPEG", quality=PDF_JPEG_QUALITY)
+
+		return self.processRenderedAsync(
+			lambda: render(False),
+			context,
+			mimeType="image/jpeg",
+			renderLossless=lambda: render(True),
+		)
 
 	def handlePdf(self, page, bbox, scale: float = 1.0,
 				  context: Optional[str] = None) -> str:
 		fut = self.handlePdfAsync(page, bbox, scale, context)
 		return fut.result()
 
+	# Describe an image produced by renderFn(), running the render on the worker pool
+	# so it overlaps with in-flight LLM calls. Batch mode renders inline instead, so
+	# every image is queued before flushBatch() runs.
+	def processRenderedAsync(self, renderFn: Callable[[], bytes], context: Optional[str] = None,
+							 mimeType: str = "image/png",
+							 renderLossless: Optional[Callable[[], bytes]] = None) -> Future:
+		future = Future()
+
+		def renderAndRoute():
+			try:
+				imageBytes = renderFn()
+			except Exception as e:
+				if self.verbose:
+					print(f"  ERR Error processing PDF image: {e}")
+				future.set_result(f"<ERROR: {str(e)}>")
+				return
+			self._routeImage(ImageJob(imageBytes, mimeType, context, renderLossless, future), inline=True)
+
+		if self.batchMode:
+			renderAndRoute()
+		else:
+			self.llm.submit(renderAndRoute)
+		return future
+
 	def _processImageAsync(self, imageBytes: bytes, context: Optional[str] = None) -> Future:
-		# Central processing logic: Cache -> Categorize -> Dispatch
+		# Central processing logic: Cache -> Analyze (categorize + describe) -> Dispatch
+		job = ImageJob(imageBytes, context=context)
+		self._routeImage(job)
+		return job.future
+
+	# Resolve from cache, queue for the batch, or describe (submitted to the worker pool,
+	# or run in place when the caller is already a worker)
+	def _routeImage(self, job: ImageJob, inline: bool = False) -> None:
 		if self.enableCache and self.cache:
-			imageHash = self.cache.getImageHash(imageBytes)
-			cached = self.cache.get(imageHash)
+			job.imageHash = self.cache.getImageHash(job.imageBytes)
+			cached = self.cache.get(job.imageHash) or self.cache.migrate(job.imageHash, job.imageBytes)
 			if cached:
-				self.cacheHitCount += 1
+				with self.statsLock:
+					self.cacheHitCount += 1
+					hitNumber = self.cacheHitCount
 				if self.verbose:
-					print(f"  ✓ Cached description (hit #{self.cacheHitCount})")
-				fut = Future()
-				fut.set_result(cached)
-				return fut
+					print(f"  ✓ Cached description (hit #{hitNumber})")
+				job.future.set_result(cached)
+				return
 
-		# We need to categorize first, then dispatch. This requires chaining futures or
-		# coordinating async calls. Since `Future` doesn't easily chain, we wrap in a submit.
-		# However, categorization and extraction are separate LLM calls.
-		# To keep it non-blocking, we submit the coordination task to the LLM worker pool.
+		if self.batchMode:
+			with self._batchLock:
+				self._pendingBatch.append(job)
+			return
 
-		future = Future()
-		
-		def coordinator():
-			try:
-				# 1. Categorize
-				category = self._categorize(imageBytes)
-				if self.verbose:
-					print(f"  🔍 Encoded Image Category: {category}")
-				
-				# 2. Dispatch
-				result = self._dispatch(imageBytes, category, context)
-				
-				# 3. Cache
-				if self.enableCache and self.cache:
-					self.cache.set(imageHash, result)
-				
-				future.set_result(result)
-			except Exception as e:
-				future.set_exception(e)
+		# One LLM call categorizes and describes; only table/formula images need a
+		# second, handler-specific step. The call itself runs on the LLM event loop,
+		# so a worker is only held while the image is encoded.
+		if inline:
+			self._describeImage(job)
+		else:
+			self.llm.submit(self._describeImage, job)
 
-		self.llm.submit(coordinator)
-		return future
+	def _describeImage(self, job: ImageJob) -> None:
+		if not self._skipDecorative(job):
+			self._analyzeJob(job)
 
-	def _categorize(self, imageBytes: bytes) -> str:
-		# Synchronous call (inside coordinator thread)
-		self.apiCallCount += 1
-		imageBase64 = base64.b64encode(imageBytes).decode()
-		messages = [
-			{
-				"role": "user",
-				"content": [
-					{"type": "text", "text": CATEGORIZE_IMAGE_PROMPT},
-					{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{imageBase64}"}}
-				]
-			}
-		]
-		
-		# Using json_mode if possible, or just strict instructions
-		resp = self.llm.chat(
-			messages=messages,
+	# Realtime categorize + describe for one (non-decorative) job
+	def _analyzeJob(self, job: ImageJob) -> None:
+		try:
+			# 1. Categorize + describe (encode once; reused by any delegation)
+			dataUrl = toDataUrl(job.imageBytes, job.mimeType)
+			reply = self._analyzeAsync(dataUrl)
+		except Exception as e:
+			job.future.set_exception(e)
+			return
+		reply.add_done_callback(lambda done: self._onAnalysis(job, dataUrl, done))
+
+	# Done-callback on the LLM event loop: parse, then resolve or hand off to the pool
+	def _onAnalysis(self, job: ImageJob, dataUrl: str, reply: Future) -> None:
+		try:
+			category, result = self._parseAnalysis(reply.result())
+		except Exception as e:
+			job.future.set_exception(e)
+			return
+		if self.verbose:
+			print(f"  🔍 Encoded Image Category: {category}")
+
+		# 2. Dispatch (table/formula delegations, or a missing description) off the loop
+		if result is None:
+			self.llm.submit(self._dispatchJob, job, category, dataUrl)
+		else:
+			self._resolveJob(job, result)
+
+	# Resolve every queued batch-mode image with one Batch API job (categorize +
+	# describe); table/formula crops still go to their handlers. Items the batch
+	# fails, and every image of a batch that misses batchTimeout, are re-run in realtime.
+	def flushBatch(self, batchTimeout: float = BATCH_TIMEOUT) -> None:
+		with self._batchLock:
+			jobs, self._pendingBatch = self._pendingBatch, []
+		jobs = [job for job in jobs if not self._skipDecorative(job)]
+		if not jobs:
+			return
+		if self.verbose:
+			print(f"  📨 Batching {len(jobs)} images")
+
+		try:
+			responses = self.llm.chatBatch(
+				[self._batchMessages(job) for job in jobs],
+				model=self.model,
+				timeout=batchTimeout,
+				response_format={"type": "json_object"},
+				max_completion_tokens=1000,
+			)
+		except TimeoutError as e:
+			print(f"⚠️  Image batch timed out, describing {len(jobs)} images in realtime: {e}")
+			for job in jobs:
+				self._analyzeJob(job)
+			return
+		except Exception as e:
+			for job in jobs:
+				job.future.set_exception(e)
+			return
+
+		failed = []
+		for job, resp in zip(jobs, responses):
+			if isinstance(resp, Exception):
+				failed.append((job, resp))
+				continue
+			self._countApiCalls(1)
+			category, result = self._parseAnalysis(resp)
+			if result is None:
+				# Delegated to the table/formula handler on the worker pool
+				self.llm.submit(self._dispatchJob, job, category)
+			else:
+				self._resolveJob(job, result)
+
+		if failed:
+			print(f"⚠️  {len(failed)} batch image requests failed, retrying in realtime: {failed[0][1]}")
+			for job, _ in failed:
+				self._analyzeJob(job)
+
+	def _batchMessages(self, job: ImageJob) -> List[Dict[str, Any]]:
+		dataUrl = toDataUrl(job.imageBytes, job.mimeType)
+		return self._imageMessages(dataUrl, DESCRIBE_AND_CATEGORIZE_PROMPT)
+
+	def _dispatchJob(self, job: ImageJob, category: str, dataUrl: Optional[str] = None) -> None:
+		try:
+			result = self._dispatch(job, category, dataUrl)
+		except Exception as e:
+			result = e
+		self._resolveJob(job, result)
+
+	# Complete one job with its description (or failure), caching successes
+	def _resolveJob(self, job: ImageJob, result) -> None:
+		if isinstance(result, Exception):
+			job.future.set_exception(result)
+			return
+		if job.imageHash and self.enableCache and self.cache:
+			self.cache.set(job.imageHash, result)
+		job.future.set_result(result)
+
+	# Resolve tiny or blank images with a canned description instead of an API call
+	def _skipDecorative(self, job: ImageJob) -> bool:
+		if not isDecorative(job.imageBytes):
+			return False
+		with self.statsLock:
+			self.decorativeCount += 1
+		if self.verbose:
+			print("  ⏭️  Skipping decorative image")
+		self._resolveJob(job, DECORATIVE_IMAGE)
+		return True
+
+	# Categorize and describe in one call; the Future's reply goes through _parseAnalysis
+	def _analyzeAsync(self, dataUrl: str) -> Future:
+		self._countApiCalls(1)
+		return self.llm.chatFuture(
+			messages=self._imageMessages(dataUrl, DESCRIBE_AND_CATEGORIZE_PROMPT),
 			model=self.model,
-			response_format={"type": "json_object"}
+			response_format={"type": "json_object"},
+			max_completion_tokens=1000
 		)
-		
+
+	# Returns (category, description JSON or None). None means the image still needs
+	# _dispatch (table/formula, or no usable description).
+	def _parseAnalysis(self, resp: str) -> Tuple[str, Optional[str]]:
 		try:
-			data = json.loads(resp)
-			return data.get("type", "Photo")
+			data = loadsJson(resp)
 		except Exception:
-			return "Photo"
-
-	def _dispatch(self, imageBytes: bytes, category: str, context: Optional[str]) -> str:
-		# Dispatch based on category
-		cat = category.lower()
-		
-		if "table" in cat:
-			if self.tableHandler:
-				return json.dumps(self.tableHandler.handleImage(imageBytes))
-			else:
-				# Fallback if no handler
-				return self._generateDescription(imageBytes, DESCRIBE_TEXT_IMAGE_PROMPT)
+			return "Photo", None
+		category = data.get("type") or "Photo"
+		description = data.get("description")
+		if not isinstance(description, dict) or self._describePrompt(category) is None:
+			return category, None
+		return category, dumpsJson(description)
 
-		if "math" in cat or "formula" in cat:
-			if self.formulaHandler:
-				return json.dumps(self.formulaHandler.handleImage(imageBytes))
-			else:
-				return self._generateDescription(imageBytes, DESCRIBE_TEXT_IMAGE_PROMPT)
-
-		# Specific handlers
-		if "chart" in cat or "graph" in cat:
-			return self._generateDescription(imageBytes, DESCRIBE_CHART_PROMPT)
-		
-		if "diagram" in cat or "technical" in cat:
-			return self._generateDescription(imageBytes, DESCRIBE_DIAGRAM_PROMPT)
-			
-		if "flowchart" in cat:
-			return self._generateDescription(imageBytes, DESCRIBE_FLOWCHART_PROMPT)
-			
-		if "text" in cat:
-			return self._generateDescription(imageBytes, DESCRIBE_TEXT_IMAGE_PROMPT)
-			
-		# Default / Photo
-		return self._generateDescription(imageBytes, DESCRIBE_PHOTO_PROMPT)
-
-	def _generateDescription(self, imageBytes: bytes, prompt: str) -> str:
-		self.apiCallCount += 1
-		imageBase64 = base64.b64encode(imageBytes).decode()
-		messages = [
+	def _dispatch(self, job: ImageJob, category: str, dataUrl: Optional[str] = None) -> str:
+		# Dispatch based on category (the job's hash lets delegates reuse earlier results)
+		kind = categoryKind(category)
+		isTable = kind == "table" and self.tableHandler
+		isFormula = kind == "formula" and self.formulaHandler
+
+		dataUrl = dataUrl or toDataUrl(job.imageBytes, job.mimeType)
+
+		if isTable or isFormula:
+			imageBytes = job.imageBytes
+			if job.renderLossless is not None:
+				# Delegates read cell/symbol detail, so re-render lossy crops as PNG
+				imageBytes = job.renderLossless()
+				dataUrl = toDataUrl(imageBytes)
+			handler = self.tableHandler if isTable else self.formulaHandler
+			return dumpsJson(handler.handleImage(imageBytes, dataUrl=dataUrl, imageHash=job.imageHash))
+
+		return self._generateDescription(dataUrl, self._describePrompt(category))
+
+	# Description prompt for a category; None when a dedicated handler takes the image
+	def _describePrompt(self, category: str) -> Optional[str]:
+		return self._kindPrompts[categoryKind(category)]
+
+	def _generateDescription(self, dataUrl: str, prompt: str) -> str:
+		self._countApiCalls(1)
+		# Using json_object response format for all consistent extraction
+		return self.llm.chat(
+			messages=self._imageMessages(dataUrl, prompt),
+			model=self.model,
+			response_format={"type": "json_object"},
+			max_completion_tokens=1000
+		)
+
+	def _imageMessages(self, dataUrl: str, prompt: str) -> List[Dict[str, Any]]:
+		return [
 			{
 				"role": "user",
 				"content": [
 					{"type": "text", "text": prompt},
-					{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{imageBase64}"}}
+					{"type": "image_url", "image_url": {"url": dataUrl}}
 				]
 			}
 		]
-		# Using json_object response format for all consistent extraction
-		return self.llm.chat(
-			messages=messages,
-			model=self.model,
-			response_format={"type": "json_object"},
-			max_completion_tokens=1000
-		)
+
+	def _countApiCalls(self, count: int) -> None:
+		with self.statsLock:
+			self.apiCallCount += count
 
 	def getStats(self) -> Dict[str, int]:
 		stats = {
 			'api_calls': self.apiCallCount,
 			'cache_hits': self.cacheHitCount,
-			'total_requests': self.apiCallCount + self.cacheHitCount
+			'decorative_skipped': self.decorativeCount,
+			'total_requests': self.apiCallCount + self.cacheHitCount + self.decorativeCount
 		}
 		if self.enableCache and self.cache:
 			stats.update(self.cache.stats())
 		return stats
+
+
+# --- Helpers ------------------------------------------------------------
+
+# Canonical kind for an LLM category label (exact label first, then keywords; default photo)
+def categoryKind(category: str) -> str:
+	cat = category.strip().lower()
+	kind = CATEGORY_KINDS.get(cat)
+	if kind is not None:
+		return kind
+	for keyword, kind in CATEGORY_KEYWORDS:
+		if keyword in cat:
+			return kind
+	return "photo"
+
+
+# Too small or too uniform to be worth describing; undecodable images are not skipped
+def isDecorative(imageBytes: bytes) -> bool:
+	try:
+		image = Image.open(io.BytesIO(imageBytes))
+		width, height = image.size
+		if width * height < DECORATIVE_MIN_PIXELS:
+			return True
+		image.draft("L", DECORATIVE_SAMPLE_SIZE)  # JPEG: decode at reduced scale
+		image = image.convert("L")
+		image.thumbnail(DECORATIVE_SAMPLE_SIZE)
+		return float(np.asarray(image).std()) < DECORATIVE_MIN_STD
+	except Exception:
+		return False
@@ -1,13 +1,20 @@
-import base64
 import io
-import json
+import threading
 from typing import Any, Dict, List, Optional
 
 import fitz  # PyMuPDF
+import numpy as np
 import pdfplumber
 from PIL import Image
 
+from app.services.ingester.handlers.utils import (
+	encodePng,
+	hashImage,
+	pixmapSamples,
+	toDataUrl,
+)
 from app.services.ingester.prompts import DESCRIBE_TABLE_PROMPT
+from app.services.ingester.services.utils import loadsJson
 
 # --- Classes ------------------------------------------------------------
 
@@ -16,22 +23,37 @@ class TableHandler:
 	# Now supports handling raw image bytes directly via handleImage.
 
 	def __init__(self, apiKey: Optional[str] = None, llmClient=None,
-				 enableGptFallback: bool = True, verbose: bool = True):
+				 enableGptFallback: bool = True, verbose: bool = True,
+				 renderLock: Optional[threading.Lock] = None):
 		# Initialize table handler.
 		self.apiKey = apiKey
 		self.llm = llmClient
 		self.enableGptFallback = enableGptFallback and apiKey and llmClient
 		self.verbose = verbose
+		self.renderLock = renderLock or threading.Lock()  # shared fitz lock
 
 		# Track usage
 		self.pdfplumberSuccess = 0
 		self.gptFallbackUsed = 0
 
-	def handleImage(self, imageBytes: bytes) -> Dict[str, Any]:
+		# Open pdfplumber documents by path, reused across tables of the same file
+		self._pdfplumberCache: Dict[str, Any] = {}
+		# Successful image extractions by content hash, so repeated images skip the LLM
+		self._resultCache: Dict[str, Dict[str, Any]] = {}
+
+	def handleImage(self, imageBytes: bytes, dataUrl: Optional[str] = None,
+					imageHash: Optional[str] = None) -> Dict[str, Any]:
 		# Extract table from raw image bytes (delegated from ImageHandler)
+		# dataUrl/imageHash: the caller's already-encoded image and its hash, if known
 		try:
-			result = self._extractWithGptBytes(imageBytes)
-			return result
+			imageHash = imageHash or hashImage(imageBytes)
+			cached = self._resultCache.get(imageHash)
+			if cached is not None:
+				return dict(cached)
+			result = self._extractWithGptBytes(imageBytes, dataUrl=dataUrl)
+			if 'error' not in result:
+				self._resultCache[imageHash] = result
+			return dict(result)
 		except Exception as e:
 			if self.verbose:
 				print(f"  ❌ Error extracting table from image: {e}")
@@ -127,42 +149,61 @@ class TableHandler:
 			# Get the PDF file path from the page
 			pdfPath = page.parent.name
 
-			# Open with pdfplumber
-			with pdfplumber.open(pdfPath) as pdf:
-				pdfPage = pdf.pages[page.number]
+			# Reuse the parsed document across tables
+			pdf = self._getPdf(pdfPath)
+			pdfPage = pdf.pages[page.number]
 
-				# Crop to bbox region
-				x0, y0, x1, y1 = bbox
-				cropped = pdfPage.crop((x0, y0, x1, y1))
+			# Crop to bbox region
+			x0, y0, x1, y1 = bbox
+			cropped = pdfPage.crop((x0, y0, x1, y1))
 
-				# Extract tables from cropped region
-				tables = cropped.extract_tables()
+			# Extract tables from cropped region
+			tables = cropped.extract_tables()
 
-				if not tables or len(tables) == 0:
-					return None
+			if not tables or len(tables) == 0:
+				return None
 
-				# Take the first/largest table
-				tableData = tables[0]
+			# Take the first/largest table
+			tableData = tables[0]
 
-				if not tableData or len(tableData) == 0:
-					return None
+			if not tableData or len(tableData) == 0:
+				return None
 
-				# Build normalized result
-				return self._buildResult(tableData, None, 'pdfplumber')
+			# Build normalized result
+			return self._buildResult(tableData, None, 'pdfplumber')
 
 		except Exception as e:
 			if self.verbose:
 				print(f"  ⚠️  pdfplumber error: {e}")
 			return None
 
+	# Open (once) the pdfplumber document for a path
+	def _getPdf(self, pdfPath: str):
+		pdf = self._pdfplumberCache.get(pdfPath)
+		if pdf is None:
+			pdf = pdfplumber.open(pdfPath)
+			self._pdfplumberCache[pdfPath] = pdf
+		return pdf
+
+	# Close cached pdfplumber documents (call at the end of each document)
+	def close(self) -> None:
+		cached, self._pdfplumberCache = self._pdfplumberCache, {}
+		for pdf in cached.values():
+			try:
+				pdf.close()
+			except Exception as e:
+				if self.verbose:
+					print(f"  ⚠️  pdfplumber close error: {e}")
+
 	def _extractWithGpt(self, page, bbox) -> Dict[str, Any]:
 		# Extract table using GPT-4o Vision as fallback.
 		try:
 			# Render the table region as image
 			rect = fitz.Rect(bbox)
 			mat = fitz.Matrix(2.0, 2.0)  # 2x zoom
-			pix = page.get_pixmap(matrix=mat, clip=rect)
-			imageBytes = pix.tobytes("png")
+			with self.renderLock:
+				samples = pixmapSamples(page.get_pixmap(matrix=mat, clip=rect))
+			imageBytes = encodePng(samples)  # outside the lock
 			
 			return self._extractWithGptBytes(imageBytes, source='gpt-4o-pdf-fallback')
 
@@ -174,10 +215,12 @@ class TableHandler:
 				'source': 'gpt-4o'
 			}
 
-	def _extractWithGptBytes(self, imageBytes: bytes, source: str = 'gpt-4o-image') -> Dict[str, Any]:
+	def _extractWithGptBytes(self, imageBytes: bytes, source: str = 'gpt-4o-image',
+							 dataUrl: Optional[str] = None) -> Dict[str, Any]:
 		# Helper to call LLM with image bytes
 		try:
-			imageBase64 = base64.b64encode(imageBytes).decode()
+			if dataUrl is None:
+				dataUrl = toDataUrl(imageBytes)
 			prompt = DESCRIBE_TABLE_PROMPT
 
 			messages = [
@@ -188,7 +231,7 @@ class TableHandler:
 						{
 							"type": "image_url",
 							"image_url": {
-								"url": f"data:image/png;base64,{imageBase64}"
+								"url": dataUrl
 							},
 						},
 					],
@@ -206,7 +249,7 @@ class TableHandler:
 			)
 
 			try:
-				parsedData = json.loads(response)
+				parsedData = loadsJson(response)
 			except Exception:
 				parsedData = self._parseGptJson(response)
 				
@@ -256,41 +299,33 @@ class TableHandler:
 	def _extractBalanced(self, s: str, openCh: str, closeCh: str) -> Optional[str]:
 		start = s.find(openCh)
 		if start == -1: return None
-		depth = 0
-		for i in range(start, len(s)):
-			ch = s[i]
-			if ch == openCh: depth += 1
-			elif ch == closeCh: depth -= 1
-			if depth == 0: return s[start:i + 1]
-		return None
+		# Running depth from the first opener in one vectorized pass. Brackets are ASCII,
+		# so byte offsets in the UTF-8 tail always land on character boundaries.
+		tail = s[start:].encode('utf-8')
+		codes = np.frombuffer(tail, dtype=np.uint8)
+		depth = np.cumsum((codes == ord(openCh)).astype(np.int32) - (codes == ord(closeCh)))
+		end = int(np.argmax(depth == 0))
+		if depth[end] != 0: return None
+		return tail[:end + 1].decode('utf-8')
 
 	def _normalizeData(self, data: List[List[str]]) -> List[List[str]]:
 		# Trim and pad rows to equal length
 		if not data:
 			return []
-		maxCols = 0
-		cleaned = []
-		for row in data:
-			vals = []
-			if isinstance(row, list):
-				for cell in row:
-					vals.append(cell.strip() if isinstance(cell, str) else "")
-			cleaned.append(vals)
-			if len(vals) > maxCols:
-				maxCols = len(vals)
+		cleaned = [
+			[cell.strip() if isinstance(cell, str) else "" for cell in row] if isinstance(row, list) else []
+			for row in data
+		]
+		maxCols = max(map(len, cleaned))
 		if maxCols == 0:
 			return cleaned
-		normalized = []
-		for row in cleaned:
-			padded = row + [""] * (maxCols - len(row))
-			normalized.append(padded)
-		return normalized
+		return [row + [""] * (maxCols - len(row)) if len(row) < maxCols else row for row in cleaned]
 
 	def _buildResult(self, data: List[List[str]], bbox, source: str) -> Dict[str, Any]:
 		# Build uniform result for any extractor
 		normalized = self._normalizeData(data)
 		rows = len(normalized)
-		cols = max((len(r) for r in normalized), default=0)
+		cols = len(normalized[0]) if normalized else 0  # rows are padded to equal length
 		return {
 			'type': 'table',
 			'rows': rows,
@@ -303,13 +338,13 @@ class TableHandler:
 	def _toMarkdown(self, data: List[List[str]]) -> str:
 		if not data or len(data) == 0:
 			return ""
-		lines = []
 		headerRow = data[0]
-		lines.append("| " + " | ".join(headerRow) + " |")
-		lines.append("| " + " | ".join(["---"] * len(headerRow)) + " |")
-		for row in data[1:]:
-			paddedRow = row + [""] * (len(headerRow) - len(row))
-			lines.append("| " + " | ".join(paddedRow) + " |")
+		width = len(headerRow)
+		lines = [
+			"| " + " | ".join(headerRow) + " |",
+			"| " + " | ".join(["---"] * width) + " |",
+		]
+		lines.extend("| " + " | ".join(row + [""] * (width - len(row))) + " |" for row in data[1:])
 		return "\n".join(lines)
 
 	def getStats(self) -> Dict[str, int]:
@@ -1,10 +1,18 @@
+import re
+import threading
+
 import fitz  # PyMuPDF
 
+WHITESPACE_RE = re.compile(r"\s+")  # same characters str.split() breaks on
+
 # --- Classes ------------------------------------------------------------
 
 class TextHandler:
 	# Handles text extraction for PPTX and PDF.
 
+	def __init__(self, renderLock=None):
+		self.renderLock = renderLock or threading.Lock()  # shared fitz lock
+
 	def handlePptx(self, shape, **kwargs):
 		# Extract text from PPTX shape.
 		if not shape.has_text_frame:
@@ -23,7 +31,8 @@ class TextHandler:
 		)
 
 		# Extract text within bbox
-		text = page.get_text("text", clip=scaledRect)
+		with self.renderLock:
+			text = page.get_text("text", clip=scaledRect)
 
 		# Clean up whitespace
-		return " ".join(text.split()).strip()
+		return WHITESPACE_RE.sub(" ", text).strip()
@@ -0,0 +1,59 @@
+import binascii
+import hashlib
+import io
+from typing import Tuple
+
+from PIL import Image
+
+try:
+	from blake3 import blake3
+except Exception:
+	blake3 = None
+
+try:
+	import xxhash
+except Exception:
+	xxhash = None
+
+PNG_COMPRESS_LEVEL = 1  # vision payloads are discarded after the call; favor encode speed
+
+# --- Helpers ------------------------------------------------------------
+
+# Content key for an image: BLAKE3 or xxh3-128 when installed (several times faster
+# than SHA-256), else SHA-256. Non-SHA keys carry an algorithm prefix so keys from
+# different hashes never collide; entries under an old SHA-256 key are moved over
+# on first use by ImageCache.migrate.
+def hashImage(imageBytes) -> str:
+	if blake3 is not None:
+		return "blake3:" + blake3(imageBytes).hexdigest()
+	if xxhash is not None:
+		return "xxh128:" + xxhash.xxh3_128_hexdigest(imageBytes)
+	return hashlib.sha256(imageBytes).hexdigest()
+
+
+# Copy a pixmap's pixels (call under the render lock) for encoding without it
+def pixmapSamples(pix) -> Tuple[bytes, int, int, str]:
+	mode = "RGBA" if pix.alpha else ("RGB" if pix.n >= 3 else "L")
+	return bytes(pix.samples), pix.width, pix.height, mode
+
+
+# Encode pixmapSamples() output with PIL; zlib/libjpeg release the GIL, so workers overlap
+def encodeSamples(samples: Tuple[bytes, int, int, str], fmt: str, **params) -> bytes:
+	data, width, height, mode = samples
+	image = Image.frombytes(mode, (width, height), data)
+	if fmt == "JPEG" and mode != "RGB":
+		image = image.convert("RGB")
+	buf = io.BytesIO()
+	image.save(buf, fmt, **params)
+	return buf.getvalue()
+
+
+def encodePng(samples: Tuple[bytes, int, int, str]) -> bytes:
+	return encodeSamples(samples, "PNG", compress_level=PNG_COMPRESS_LEVEL)
+
+
+# Image data URL for the vision API. b2a_base64 reads any buffer (bytes, bytearray,
+# memoryview) without an intermediate copy, and the ASCII result is decoded once.
+def toDataUrl(imageBytes, mimeType: str = "image/png") -> str:
+	encoded = binascii.b2a_base64(imageBytes, newline=False)
+	return f"data:{mimeType};base64,{encoded.decode('ascii')}"
@@ -1,4 +1,5 @@
 import os
+import re
 
 # Helper to load prompt content
 def _load_prompt(filename):
@@ -9,6 +10,34 @@ def _load_prompt(filename):
 	except FileNotFoundError:
 		return ""
 
+# str.format-style template limited to known field names, split once at import so
+# rendering is a single join. "{{"/"}}" become literal braces as with str.format;
+# any other brace text (e.g. a JSON example in the prompt) is kept verbatim.
+class PromptTemplate:
+	def __init__(self, template, fields):
+		self.template = template
+		pattern = re.compile(r"\{\{|\}\}|\{(" + "|".join(map(re.escape, fields)) + r")\}")
+		self.parts, self.slots = [], []
+		literal, pos = [], 0
+		for match in pattern.finditer(template):
+			literal.append(template[pos:match.start()])
+			if match.group(1) is None:
+				literal.append(match.group(0)[0])
+			else:
+				self.parts.append("".join(literal))
+				literal = []
+				self.slots.append((len(self.parts), match.group(1)))
+				self.parts.append("")
+			pos = match.end()
+		literal.append(template[pos:])
+		self.parts.append("".join(literal))
+
+	def render(self, **values):
+		parts = list(self.parts)
+		for idx, name in self.slots:
+			parts[idx] = str(values[name])
+		return "".join(parts)
+
 # Load prompts into constants
 DESCRIBE_IMAGE_PROMPT = _load_prompt('describe_image.txt')
 EXTRACT_TABLE_PROMPT = _load_prompt('extract_table.txt')
@@ -29,3 +58,25 @@ DESCRIBE_FORMULA_PROMPT = _load_prompt('describe_formula.txt')
 DESCRIBE_TABLE_PROMPT = _load_prompt('describe_table.txt')
 DESCRIBE_TEXT_IMAGE_PROMPT = _load_prompt('describe_text_image.txt')
 DESCRIBE_FLOWCHART_PROMPT = _load_prompt('describe_flowchart.txt')
+
+# Fused prompt: categorize and describe in one call, one schema section per type
+DESCRIBE_AND_CATEGORIZE_PROMPT = "\n\n".join([
+	_load_prompt('describe_and_categorize.txt'),
+	"### Technical\n" + DESCRIBE_DIAGRAM_PROMPT,
+	"### Chart/Graph\n" + DESCRIBE_CHART_PROMPT,
+	"### Photo\n" + DESCRIBE_PHOTO_PROMPT,
+	"### Text-Image\n" + DESCRIBE_TEXT_IMAGE_PROMPT,
+	"### Flowchart\n" + DESCRIBE_FLOWCHART_PROMPT,
+])
+
+# Precompiled templates for prompts rendered per batch / per element
+DECOMPOSE_PROPOSITIONS_TEMPLATE = PromptTemplate(DECOMPOSE_PROPOSITIONS_PROMPT, ("context", "batch"))
+EXTRACT_EQUATION_TEXT_TEMPLATE = PromptTemplate(EXTRACT_EQUATION_TEXT_PROMPT, ("text",))
+CONCEPT_DECISIONS_USER_TEMPLATE = PromptTemplate(
+	CONCEPT_DECISIONS_USER_PROMPT,
+	("concept_outline", "context_section", "elements_list"),
+)
+UPDATE_SUMMARY_USER_TEMPLATE = PromptTemplate(
+	UPDATE_SUMMARY_USER_PROMPT,
+	("title", "summary", "element_id", "element_type", "content"),
+)
@@ -1,14 +1,18 @@
-from typing import List
+from functools import lru_cache
+from typing import List, Sequence, Tuple
 
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+EMBED_BATCH_SIZE = 64
+MODEL_CACHE_SIZE = 4  # distinct models kept loaded per process
+QUANT_LEVELS = 127  # int8 codes span [-127, 127]
 
 # --- Classes ------------------------------------------------------------
 
 class Embedder:
 	def __init__(self, modelName: str = "all-MiniLM-L6-v2"):
-		# Load a lightweight, fast model
-		self.model = SentenceTransformer(modelName)
+		# Lightweight, fast model; loaded once per process and shared by every Embedder
+		self.model = loadModel(modelName)
 
 	# Generate embedding for a single string
 	def getEmbedding(self, text: str) -> List[float]:
@@ -19,19 +23,87 @@ class Embedder:
 		embedding = self.model.encode(text)
 		return embedding.tolist()
 
-	# Compute cosine similarity between two vectors
+	# Embed many strings in batched encode calls; returns an (n, dim) float32 array of
+	# unit vectors (zero rows for empty strings)
+	def getEmbeddings(self, texts: Sequence[str], batchSize: int = EMBED_BATCH_SIZE) -> np.ndarray:
+		texts = list(texts)
+		nonEmpty = [idx for idx, text in enumerate(texts) if text]
+		if not nonEmpty:
+			return np.zeros((len(texts), 0), dtype=np.float32)
+		encoded = self.model.encode(
+			[texts[idx] for idx in nonEmpty],
+			batch_size=batchSize,
+			normalize_embeddings=True,
+			convert_to_numpy=True,
+		).astype(np.float32, copy=False)
+		if len(nonEmpty) == len(texts):
+			return encoded
+		embeddings = np.zeros((len(texts), encoded.shape[1]), dtype=np.float32)
+		embeddings[nonEmpty] = encoded
+		return embeddings
+
+	# Compute cosine similarity between two vectors (lists or arrays)
 	@staticmethod
-	def cosineSimilarity(vec1: List[float], vec2: List[float]) -> float:
-		if not vec1 or not vec2:
+	def cosineSimilarity(vec1, vec2) -> float:
+		a = np.asarray(vec1, dtype=np.float32)
+		b = np.asarray(vec2, dtype=np.float32)
+		if a.size == 0 or b.size == 0:
 			return 0.0
 
-		a = np.array(vec1)
-		b = np.array(vec2)
+		denom = float(np.sqrt(a.dot(a) * b.dot(b)))
+		if denom == 0.0:
+			return 0.0
 
-		normA = np.linalg.norm(a)
-		normB = np.linalg.norm(b)
+		return float(a.dot(b) / denom)
 
-		if normA == 0 or normB == 0:
-			return 0.0
+	# Cosine similarity of one query against every row of a matrix, in one product
+	@staticmethod
+	def cosineSimilarityBatch(query, matrix) -> np.ndarray:
+		q = np.asarray(query, dtype=np.float32)
+		m = np.asarray(matrix, dtype=np.float32)
+		if q.size == 0 or m.size == 0:
+			return np.zeros(len(m), dtype=np.float32)
+
+		denom = np.linalg.norm(m, axis=1) * np.linalg.norm(q)
+		sims = m @ q
+		return np.divide(sims, denom, out=np.zeros_like(sims), where=denom > 0)
+
+	# Symmetric int8 quantization: codes = round(v / scale), scale = max|v| / 127 per
+	# vector (per row for a matrix). A 384-dim key drops from 1.5KB to 384B.
+	@staticmethod
+	def quantize(vector) -> Tuple[np.ndarray, np.ndarray]:
+		arr = np.asarray(vector, dtype=np.float32)
+		rows = np.atleast_2d(arr)
+		peak = np.abs(rows).max(axis=1) if rows.shape[1] else np.zeros(len(rows), dtype=np.float32)
+		scales = (peak / QUANT_LEVELS).astype(np.float32)
+		safe = np.where(scales > 0, scales, 1.0)
+		codes = np.clip(np.rint(rows / safe[:, None]), -QUANT_LEVELS, QUANT_LEVELS).astype(np.int8)
+		if arr.ndim == 1:
+			return codes[0], scales[0]
+		return codes, scales
+
+	# Dot product of two quantized vectors (cosine when both were unit vectors);
+	# int32 accumulation cannot overflow below ~130k dims
+	@staticmethod
+	def quantizedSimilarity(codes1, scale1, codes2, scale2) -> float:
+		dot = np.einsum('i,i->', codes1, codes2, dtype=np.int32)
+		return float(dot * np.float32(scale1) * np.float32(scale2))
+
+	# Quantized query against every quantized row, without widening the matrix
+	@staticmethod
+	def quantizedSimilarityBatch(queryCodes, queryScale, codes, scales) -> np.ndarray:
+		if len(codes) == 0:
+			return np.zeros(0, dtype=np.float32)
+		dots = np.einsum('ij,j->i', codes, queryCodes, dtype=np.int32)
+		return dots.astype(np.float32) * scales * np.float32(queryScale)
+
+
+# --- Helpers ------------------------------------------------------------
 
-		return float(np.dot(a, b) / (normA * normB))
+# Model load takes seconds and hundreds of MB, so instances share one copy per name.
+# sentence_transformers (torch, transformers) is imported here, not at module load,
+# so importing Embedder for its similarity helpers stays cheap.
+@lru_cache(maxsize=MODEL_CACHE_SIZE)
+def loadModel(modelName: str):
+	from sentence_transformers import SentenceTransformer
+	return SentenceTransformer(modelName)
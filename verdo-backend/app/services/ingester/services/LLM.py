@@ -1,3 +1,4 @@
+import asyncio
 import os
 import queue
 import sys
@@ -5,11 +6,13 @@ import threading
 import time
 from collections import defaultdict, deque
 from concurrent.futures import Future
-from typing import Any, Callable, Dict, Sequence, Union
+from typing import Any, Callable, Dict, List, Sequence, Union
 
 import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+from app.services.ingester.services.utils import dumpsJsonBytes, loadsJson
 
 # --- Setup --------------------------------------------------------------
 
@@ -20,10 +23,14 @@ Message = Dict[str, str]
 Messages = Sequence[Message]
 Result = Union[str, Exception]
 
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_MAX_FILE_BYTES = 50 * 1024 * 1024  # split large jobs into several batch files
+BATCH_TERMINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
 # --- Classes ------------------------------------------------------------
 
 class LLM:
-	def __init__(self, maxWorkers: int = 30) -> None:
+	def __init__(self, maxWorkers: int = 30, maxInflight: int = 100) -> None:
 		# Keys
 		self.openaiKey = os.getenv("OPENAIKEY")
 		if not self.openaiKey:
@@ -43,6 +50,15 @@ class LLM:
 			),
 		)
 
+		# Async client on a private event loop: chatFuture() requests need no worker
+		# thread while they wait on the network (up to maxInflight connections).
+		# Both start on the first chatFuture() and are released by close().
+		self.maxInflight = maxInflight
+		self.asyncClient = None
+		self.eventLoop = None
+		self.loopThread = None
+		self.loopLock = threading.Lock()
+
 		# Simple per-model RPM limiting
 		self.rateLock = threading.Lock()
 		self.requestHistory = defaultdict(deque)  # model -> deque[timestamps]
@@ -68,10 +84,39 @@ class LLM:
 			worker.start()
 			self.workers.append(worker)
 
+	# Close the async client's connections and stop its event loop (if started);
+	# a later chatFuture() starts a new one
+	def close(self) -> None:
+		with self.loopLock:
+			loop, client, thread = self.eventLoop, self.asyncClient, self.loopThread
+			self.eventLoop = self.asyncClient = self.loopThread = None
+		if loop is None:
+			return
+		try:
+			asyncio.run_coroutine_threadsafe(client.close(), loop).result(timeout=10)
+		finally:
+			loop.call_soon_threadsafe(loop.stop)
+			thread.join()
+			loop.close()
+
 	# --- Internal Helpers ---------------------------------------------------
 
 	# Block if we're at the per-model RPM limit (simple 60s sliding window)
 	def rateLimit(self, model: str) -> None:
+		sleepFor = self._rateDelay(model)
+		if sleepFor > 0:
+			time.sleep(sleepFor)
+		self._recordRequest(model)
+
+	# Same limit for coroutines: waits without blocking the event loop
+	async def rateLimitAsync(self, model: str) -> None:
+		sleepFor = self._rateDelay(model)
+		if sleepFor > 0:
+			await asyncio.sleep(sleepFor)
+		self._recordRequest(model)
+
+	# Seconds to wait before the next request to this model
+	def _rateDelay(self, model: str) -> float:
 		window = 60.0
 		now = time.time()
 		rpm = self.maxRpmByModel.get(model, self.defaultRpm)
@@ -83,13 +128,29 @@ class LLM:
 				hist.popleft()
 
 			if len(hist) >= rpm:
-				sleepFor = window - (now - hist[0])
-			else:
-				sleepFor = 0.0
+				return window - (now - hist[0])
+			return 0.0
 
-		if sleepFor > 0:
-			time.sleep(sleepFor)
+	# Start the async client and its event loop thread on first use
+	def _ensureEventLoop(self) -> asyncio.AbstractEventLoop:
+		with self.loopLock:
+			if self.eventLoop is None:
+				self.asyncClient = AsyncOpenAI(
+					api_key=self.openaiKey,
+					http_client=httpx.AsyncClient(
+						limits=httpx.Limits(
+							max_keepalive_connections=self.maxInflight,
+							max_connections=self.maxInflight,
+						),
+						timeout=60.0,
+					),
+				)
+				self.eventLoop = asyncio.new_event_loop()
+				self.loopThread = threading.Thread(target=self.eventLoop.run_forever, daemon=True)
+				self.loopThread.start()
+			return self.eventLoop
 
+	def _recordRequest(self, model: str) -> None:
 		with self.rateLock:
 			self.requestHistory[model].append(time.time())
 
@@ -145,11 +206,124 @@ class LLM:
 		payload.update(options)
 
 		response = self.openaiClient.chat.completions.create(**payload)
+		return self._replyText(response)
+
+	# Coroutine version of chat(), using the async client
+	async def chatCoroutine(
+		self,
+		messages: Messages,
+		model: str = "gpt-4o",
+		**options: Any,
+	) -> str:
+		await self.rateLimitAsync(model)
+
+		payload = {
+			"model": model,
+			"messages": list(messages),
+		}
+		payload.update(options)
+
+		response = await self.asyncClient.chat.completions.create(**payload)
+		return self._replyText(response)
+
+	def _replyText(self, response) -> str:
 		choices = getattr(response, "choices", None) or []
 		if not choices:
 			raise RuntimeError("Empty response from OpenAI chat completion.")
 		return choices[0].message.content
 
+	# --- Batch Entrypoints --------------------------------------------------
+
+	# Run many chat() requests through the OpenAI Batch API (upload JSONL, poll, fan out).
+	# Returns one Result per request, in order: the reply text or the failure. Past
+	# timeout seconds, every unfinished batch is cancelled and TimeoutError raised.
+	def chatBatch(
+		self,
+		requests: Sequence[Messages],
+		model: str = "gpt-4o",
+		pollInterval: float = 15.0,
+		timeout: float = None,
+		**options: Any,
+	) -> List[Result]:
+		results: List[Result] = [RuntimeError("Missing batch result.") for _ in requests]
+		batchIds = [self._createBatch(lines) for lines in self._batchFiles(requests, model, options)]
+
+		deadline = time.time() + timeout if timeout else None
+		for pos, batchId in enumerate(batchIds):
+			try:
+				batch = self._waitForBatch(batchId, pollInterval, deadline)
+			except TimeoutError:
+				for pendingId in batchIds[pos + 1:]:
+					self.openaiClient.batches.cancel(pendingId)
+				raise
+			for fileId in (batch.output_file_id, batch.error_file_id):
+				if fileId:
+					self._collectBatchResults(fileId, results)
+		return results
+
+	# Serialize requests as Batch API JSONL lines, chunked by file size
+	def _batchFiles(
+		self,
+		requests: Sequence[Messages],
+		model: str,
+		options: Dict[str, Any],
+	) -> List[List[bytes]]:
+		files, current, currentBytes = [], [], 0
+		for idx, messages in enumerate(requests):
+			body = {"model": model, "messages": list(messages)}
+			body.update(options)
+			record = {
+				"custom_id": str(idx),
+				"method": "POST",
+				"url": BATCH_ENDPOINT,
+				"body": body,
+			}
+			line = dumpsJsonBytes(record)
+			if current and currentBytes + len(line) + 1 > BATCH_MAX_FILE_BYTES:
+				files.append(current)
+				current, currentBytes = [], 0
+			current.append(line)
+			currentBytes += len(line) + 1
+		if current:
+			files.append(current)
+		return files
+
+	def _createBatch(self, lines: List[bytes]) -> str:
+		batchFile = self.openaiClient.files.create(
+			file=("batch.jsonl", b"\n".join(lines)),
+			purpose="batch",
+		)
+		batch = self.openaiClient.batches.create(
+			input_file_id=batchFile.id,
+			endpoint=BATCH_ENDPOINT,
+			completion_window="24h",
+		)
+		return batch.id
+
+	def _waitForBatch(self, batchId: str, pollInterval: float, deadline: float):
+		batch = self.openaiClient.batches.retrieve(batchId)
+		while batch.status not in BATCH_TERMINAL_STATES:
+			if deadline and time.time() > deadline:
+				self.openaiClient.batches.cancel(batchId)
+				raise TimeoutError(f"Batch {batchId} did not finish in time.")
+			time.sleep(pollInterval)
+			batch = self.openaiClient.batches.retrieve(batchId)
+		return batch
+
+	# Parse an output/error JSONL file into the results list (by custom_id)
+	def _collectBatchResults(self, fileId: str, results: List[Result]) -> None:
+		for line in self.openaiClient.files.content(fileId).text.splitlines():
+			if not line.strip():
+				continue
+			record = loadsJson(line)
+			idx = int(record["custom_id"])
+			response = record.get("response") or {}
+			if response.get("status_code") == 200:
+				results[idx] = response["body"]["choices"][0]["message"]["content"]
+			else:
+				error = record.get("error") or response.get("body")
+				results[idx] = RuntimeError(f"Batch request failed: {error}")
+
 	# --- Parallel Entrypoints -----------------------------------------------
 
 	# Immediately enqueue a respond() call; returns a Future
@@ -161,6 +335,19 @@ class LLM:
 	) -> Future:
 		return self.submit(self.respond, prompt, model, **options)
 
+	# Run chat on the event loop instead of a worker thread; returns a Future whose
+	# callbacks fire on the loop thread (keep them short, submit() heavy follow-ups)
+	def chatFuture(
+		self,
+		messages: Messages,
+		model: str = "gpt-4o",
+		**options: Any,
+	) -> Future:
+		return asyncio.run_coroutine_threadsafe(
+			self.chatCoroutine(messages, model, **options),
+			self._ensureEventLoop(),
+		)
+
 	# Immediately enqueue a chat() call; returns a Future
 	def chatAsync(
 		self,
@@ -1,5 +1,12 @@
 # services package
 
-from app.services.ingester.services.LLM import LLM
-
 __all__ = ['LLM']
+
+
+# LLM pulls in openai and httpx, so it is resolved on first access instead of
+# whenever any services module is imported
+def __getattr__(name):
+	if name == 'LLM':
+		from app.services.ingester.services.LLM import LLM
+		return LLM
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
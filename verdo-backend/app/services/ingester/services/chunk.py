@@ -2,6 +2,9 @@ from typing import Dict, List, Optional
 
 
 class Chunk:
+	# Fixed attribute set: no per-instance __dict__
+	__slots__ = ("id", "data", "confidence", "embedding", "figure_ids", "source_element_ids", "relations")
+
 	def __init__(
 		self,
 		chunk_id: str,
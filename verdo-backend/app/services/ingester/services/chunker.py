@@ -5,25 +5,30 @@ from typing import Any, Dict, List
 import numpy as np
 import tiktoken
 
-from app.services.ingester.prompts import DECOMPOSE_PROPOSITIONS_PROMPT
+from app.services.ingester.prompts import DECOMPOSE_PROPOSITIONS_TEMPLATE
 from app.services.ingester.services.Embedder import Embedder
-from app.services.ingester.services.HDBSCANplus import HDBSCANplus
-from app.services.ingester.services.LLM import LLM
 from app.services.ingester.services.chunk import Chunk
+from app.services.ingester.services.utils import loadsJson
+
+DEDUP_THRESHOLD = 0.985  # propositions this similar within a cluster are duplicates
+MIN_DECOMPOSE_CHARS = 40  # shorter batches are kept as a single proposition, no LLM call
 
 # --- Classes ------------------------------------------------------------
 
 class Chunker:
-	def __init__(self):
+	# llmClient: shared LLM (e.g. the Router's); created once on first use if omitted
+	def __init__(self, llmClient=None):
+		self.llm = llmClient
 		self.elements = []           # List of content strings (non-figure)
 		self.elementMetas = []       # List of dicts {id, kind} matching self.elements
 		self.figuresById = {}        # Map figure_id -> figure_json
 		self.order = []              # List of ALL element IDs in reading order
 		self.idToElementIndex = {}   # Map non-figure ID -> index in self.elements
+		self.idToOrderPos = {}       # Map element ID -> position in self.order
 		
 		self.propositions = []
 		self.propositionSources = [] # List[List[str]] of element IDs per proposition
-		self.batches = []            # list of {indices: [], text: ""}
+		self.batches = []            # list of {indices: range, text: ""}
 		self.chunks = []
 		
 		# Semantic Clustering State
@@ -39,6 +44,7 @@ class Chunker:
 		self.figuresById = {}
 		self.order = []
 		self.idToElementIndex = {}
+		self.idToOrderPos = {}
 
 		for page in jsonData:
 			for element in page.get('elements', []):
@@ -50,6 +56,7 @@ class Chunker:
 				content = ""
 				
 				# Always track global order
+				self.idToOrderPos[el_id] = len(self.order)
 				self.order.append(el_id)
 
 				# Handle Figures/Images/Math separately - do not add to decompose list
@@ -75,37 +82,33 @@ class Chunker:
 					self.idToElementIndex[el_id] = idx
 
 	# Batches elements based on a token threshold using tiktoken
+	# Batches are contiguous element runs, so "indices" is a range (no per-batch list)
 	def batch(self, threshold: int = 500):
 		encoder = tiktoken.get_encoding("cl100k_base")
+		# One native call tokenizes every element
+		tokenCounts = [len(tokens) for tokens in encoder.encode_batch(self.elements)]
 
 		self.batches = []
-		currentIndices = []
+		start = 0
 		currentTextToks = 0
 
-		for idx, element in enumerate(self.elements):
-			elementTokens = len(encoder.encode(element))
-
+		for idx, elementTokens in enumerate(tokenCounts):
 			if currentTextToks + elementTokens < threshold:
-				currentIndices.append(idx)
 				currentTextToks += elementTokens
 			else:
-				if currentIndices:
-					# Store batch info
-					batchText = "\n".join([self.elements[i] for i in currentIndices])
-					self.batches.append({
-						"indices": currentIndices,
-						"text": batchText
-					})
-				
-				currentIndices = [idx]
+				if idx > start:
+					self._addBatch(start, idx)
+				start = idx
 				currentTextToks = elementTokens
 
-		if currentIndices:
-			batchText = "\n".join([self.elements[i] for i in currentIndices])
-			self.batches.append({
-				"indices": currentIndices,
-				"text": batchText
-			})
+		if len(tokenCounts) > start:
+			self._addBatch(start, len(tokenCounts))
+
+	def _addBatch(self, start: int, end: int):
+		self.batches.append({
+			"indices": range(start, end),
+			"text": "\n".join(self.elements[start:end])
+		})
 
 	# Build context window including surrounding elements and figures
 	def _buildContextWindow(self, batchIndices: List[int], windowRadius: int = 3):
@@ -116,8 +119,8 @@ class Chunker:
 		batchIds = [self.elementMetas[i]["id"] for i in batchIndices]
 
 		# 2. Find min and max positions in global order for these IDs
-		#    Build a mapping from id -> position in self.order for efficiency
-		idToOrderPos = {elId: pos for pos, elId in enumerate(self.order)}
+		#    (id -> position map is built once in getElements, not per batch)
+		idToOrderPos = self.idToOrderPos or {elId: pos for pos, elId in enumerate(self.order)}
 
 		batchPositions = [idToOrderPos[elId] for elId in batchIds if elId in idToOrderPos]
 		if not batchPositions:
@@ -151,7 +154,10 @@ class Chunker:
 
 	# Generates propositions from batches using LLM
 	def getPropositions(self):
-		self.llm = LLM()
+		# Reuse the worker pool across calls instead of starting a new LLM each time
+		if self.llm is None:
+			from app.services.ingester.services.LLM import LLM
+			self.llm = LLM()
 		self.propositions = []
 		self.propositionSources = []
 
@@ -160,12 +166,17 @@ class Chunker:
 		for i, batchData in enumerate(self.batches):
 			batchText = batchData["text"]
 			batchIndices = batchData["indices"]
+
+			# A title, caption or lone bullet has nothing to decompose
+			if len(batchText.strip()) < MIN_DECOMPOSE_CHARS:
+				futures.append(None)
+				continue
 			
 			# Build Context
 			contextItems = self._buildContextWindow(batchIndices, windowRadius=5)
 			contextText = "\n\n".join(contextItems)
             
-			prompt = DECOMPOSE_PROPOSITIONS_PROMPT.format(context=contextText, batch=batchText)
+			prompt = DECOMPOSE_PROPOSITIONS_TEMPLATE.render(context=contextText, batch=batchText)
 			
 			# Using chatAsync which returns a Future
 			futures.append(self.llm.chatAsync(
@@ -177,11 +188,16 @@ class Chunker:
 
 		# Wait for all futures to complete
 		for i, future in enumerate(futures):
+			if future is None:
+				source_ids = [self.elementMetas[idx]["id"] for idx in self.batches[i]["indices"]]
+				self.propositions.append(self.batches[i]["text"].strip())
+				self.propositionSources.append(source_ids)
+				continue
 			try:
 				response = future.result()
 				try:
-					data = json.loads(response)
-					props = data.get("propositions", [])
+					data = parseJsonResponse(response)
+					props = data.get("propositions", []) if isinstance(data, dict) else None
 					source_ids = [self.elementMetas[idx]["id"] for idx in self.batches[i]["indices"]]
 					if isinstance(props, list):
 						self.propositions.extend(props)
@@ -194,8 +210,7 @@ class Chunker:
 						else:
 							print(f"Warning: JSON output in batch {i} did not contain 'propositions' list.")
 				except json.JSONDecodeError as e:
-					print(f"JSON Decode Error in batch {i}: {e}")
-					print(f"Response snippet: {response[:100]}...")
+					print(f"JSON Decode Error in batch {i}: {e} (response length {len(response)})")
 			except Exception as e:
 				print(f"Error processing batch {i}: {e}")
 
@@ -204,12 +219,9 @@ class Chunker:
 	# Embeds all extracted propositions
 	def embedPropositions(self):
 		embedder = Embedder()
-		self.propositionEmbeddings = []
-		
-		for prop in self.propositions:
-			embedding = embedder.getEmbedding(prop)
-			self.propositionEmbeddings.append(embedding)
-			
+		# One batched encode instead of one model call per proposition
+		self.propositionEmbeddings = embedder.getEmbeddings(self.propositions).tolist()
+
 		if len(self.propositionEmbeddings) != len(self.propositions):
 			raise ValueError("Mismatch between proposition count and embedding count.")
 			
@@ -222,6 +234,9 @@ class Chunker:
 			print("No embeddings to cluster.")
 			return
 
+		# hdbscan / sklearn are only loaded once there is something to cluster
+		from app.services.ingester.services.HDBSCANplus import HDBSCANplus
+
 		# Convert embeddings to numpy array
 		X = np.array(self.propositionEmbeddings, dtype=np.float32)
 		
@@ -256,13 +271,12 @@ class Chunker:
 				clusters[label] = []
 			clusters[label].append(idx)
 			
-		embedder = Embedder() # Used for intra-cluster dedup
+		embeddings = np.asarray(self.propositionEmbeddings, dtype=np.float32)
 		self.semanticChunks = []
 		
 		for label in sorted(clusters.keys()):
 			indices = clusters[label]
 			chunkPropositions = []
-			acceptedIndices = []
 			figureIds = set()
 			sourceElementIds = set()
 			
@@ -270,29 +284,17 @@ class Chunker:
 			clusterProbs = [probabilities[i] for i in indices]
 			confidence = np.mean(clusterProbs) if clusterProbs else 0.0
 			
-			for idx in indices:
+			# Intra-cluster Deduplication
+			acceptedIndices = self._dedupIndices(embeddings, indices)
+			for idx in acceptedIndices:
 				propText = self.propositions[idx]
-				propEmbedding = self.propositionEmbeddings[idx]
-				
-				# Intra-cluster Deduplication
-				isDuplicate = False
-				for existingIdx in acceptedIndices:
-					existingEmbedding = self.propositionEmbeddings[existingIdx]
-					sim = embedder.cosineSimilarity(propEmbedding, existingEmbedding)
-					if sim >= 0.985:
-						isDuplicate = True
-						break
-				
-				if not isDuplicate:
-					chunkPropositions.append(propText)
-					acceptedIndices.append(idx)
-					sourceElementIds.update(self.propositionSources[idx])
-					figureIds.update(re.findall(r"\[FIGURE ([^\]]+)\]", propText))
+				chunkPropositions.append(propText)
+				sourceElementIds.update(self.propositionSources[idx])
+				figureIds.update(re.findall(r"\[FIGURE ([^\]]+)\]", propText))
 
 			chunkEmbedding = None
 			if acceptedIndices:
-				acceptedEmbeddings = [self.propositionEmbeddings[i] for i in acceptedIndices]
-				chunkEmbedding = np.mean(np.array(acceptedEmbeddings, dtype=np.float32), axis=0).tolist()
+				chunkEmbedding = embeddings[acceptedIndices].mean(axis=0).tolist()
 
 			# Create chunk object
 			chunk = Chunk(
@@ -305,3 +307,43 @@ class Chunker:
 				relations={},
 			)
 			self.semanticChunks.append(chunk)
+
+	# Greedy near-duplicate removal: keep a proposition unless its cosine with one
+	# already kept is >= threshold. One Gram matrix per cluster replaces the
+	# pairwise Python loop.
+	@staticmethod
+	def _dedupIndices(
+		embeddings: np.ndarray,
+		indices: List[int],
+		threshold: float = DEDUP_THRESHOLD,
+	) -> List[int]:
+		if not indices:
+			return []
+		vectors = embeddings[indices]
+		norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+		unit = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+		nearDuplicate = (unit @ unit.T) >= threshold
+		kept = np.zeros(len(indices), dtype=bool)
+		for pos in range(len(indices)):
+			if not nearDuplicate[pos, kept].any():
+				kept[pos] = True
+		return [idx for idx, keep in zip(indices, kept) if keep]
+
+
+# --- Helpers ------------------------------------------------------------
+
+# Drop a ```json ... ``` markdown fence the model sometimes wraps around its output
+def stripFences(text: str) -> str:
+	text = text.strip()
+	if text.startswith("```"):
+		text = text.split("\n", 1)[1] if "\n" in text else ""
+		text = text.rstrip()
+		if text.endswith("```"):
+			text = text[:-3]
+	return text.strip()
+
+
+# Parse an LLM JSON reply; JSONDecodeError on bad input (orjson.JSONDecodeError
+# subclasses json.JSONDecodeError)
+def parseJsonResponse(response: str):
+	return loadsJson(stripFences(response))
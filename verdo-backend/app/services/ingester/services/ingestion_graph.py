@@ -1,18 +1,29 @@
+from __future__ import annotations
+
 from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Set, Tuple
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 
 import numpy as np
 
-from app.services.ingester.services.LLM import LLM
 from app.services.ingester.services.chunk import Chunk
+from app.services.ingester.services.semantic_cache import SemanticCache
+
+if TYPE_CHECKING:
+	# Only used in annotations; the caller passes an already-built LLM
+	from app.services.ingester.services.LLM import LLM
 
 ANN_PLANES = 12
 ANN_SEED = 42
 ANN_TABLES = 6
+# A pair key's cosine is the mean of the two chunk cosines, so 0.995 keeps each
+# chunk at >= 0.99 (less int8 rounding): only near-duplicate pairs share a description
+RELATION_REUSE_THRESHOLD = 0.995
+RELATION_CACHE_PATH = "./cache/relations/relations.npz"
 
 
-@dataclass
+@dataclass(slots=True)
 class GraphNode:
 	id: str
 	type: str
@@ -20,7 +31,7 @@ class GraphNode:
 	metadata: dict = field(default_factory=dict)
 
 
-@dataclass
+@dataclass(slots=True)
 class GraphEdge:
 	from_id: str
 	to_id: str
@@ -57,8 +68,13 @@ def buildGraph(
 	relatedTopK: int = 3,
 	relatedThreshold: float = 0.8,
 	llm: Optional[LLM] = None,
+	relationCache: Optional[SemanticCache] = None,
 ) -> IngestionGraph:
 	graph = IngestionGraph()
+	# Relation descriptions are reused for the reverse direction of a pair and for pairs
+	# whose chunks are both near-duplicates (RELATION_REUSE_THRESHOLD) of a cached pair
+	if llm is not None and relationCache is None:
+		relationCache = defaultRelationCache()
 
 	for chunk in chunks:
 		graph.addNode(GraphNode(
@@ -81,11 +97,20 @@ def buildGraph(
 		))
 
 	_addFigureEdges(graph, chunks, figuresById)
-	_addRelatedChunkEdges(graph, chunks, relatedTopK, relatedThreshold, llm)
+	_addRelatedChunkEdges(graph, chunks, relatedTopK, relatedThreshold, llm, relationCache)
+	if relationCache is not None:
+		relationCache.save()
 
 	return graph
 
 
+# Process-wide relation cache persisted at RELATION_CACHE_PATH, so re-ingesting a
+# document reuses the descriptions of its earlier run
+@lru_cache(maxsize=1)
+def defaultRelationCache() -> SemanticCache:
+	return SemanticCache(cachePath=RELATION_CACHE_PATH)
+
+
 def _addFigureEdges(graph: IngestionGraph, chunks: List[Chunk], figuresById: Dict[str, dict]):
 	figureSet = set(figuresById.keys())
 	for chunk in chunks:
@@ -116,12 +141,13 @@ def _addRelatedChunkEdges(
 	relatedTopK: int,
 	relatedThreshold: float,
 	llm: Optional[LLM],
+	relationCache: Optional[SemanticCache] = None,
 ):
 	if len(chunks) <= relatedTopK + 1:
-		_addRelatedChunkEdgesExact(graph, chunks, relatedTopK, relatedThreshold, llm)
+		_addRelatedChunkEdgesExact(graph, chunks, relatedTopK, relatedThreshold, llm, relationCache)
 		return
 
-	_addRelatedChunkEdgesAnn(graph, chunks, relatedTopK, relatedThreshold, llm)
+	_addRelatedChunkEdgesAnn(graph, chunks, relatedTopK, relatedThreshold, llm, relationCache)
 
 
 # Builds related_to edges using full pairwise comparisons for small corpora
@@ -131,8 +157,10 @@ def _addRelatedChunkEdgesExact(
 	relatedTopK: int,
 	relatedThreshold: float,
 	llm: Optional[LLM],
+	relationCache: Optional[SemanticCache] = None,
 ):
 	embeddings = [chunk.embedding for chunk in chunks]
+	relations = []
 	for idx, chunk in enumerate(chunks):
 		if embeddings[idx] is None:
 			continue
@@ -144,7 +172,9 @@ def _addRelatedChunkEdgesExact(
 			score = _cosineSimilarity(embeddings[idx], embeddings[otherIdx])
 			sims.append((otherIdx, score))
 
-		_addRelatedCandidates(graph, chunk, chunks, sims, relatedTopK, relatedThreshold, llm)
+		relations.extend(_selectRelated(chunk, chunks, sims, relatedTopK, relatedThreshold))
+
+	_addRelationEdges(graph, relations, llm, relationCache)
 
 
 # Builds related_to edges using ANN candidate selection
@@ -154,22 +184,24 @@ def _addRelatedChunkEdgesAnn(
 	relatedTopK: int,
 	relatedThreshold: float,
 	llm: Optional[LLM],
+	relationCache: Optional[SemanticCache] = None,
 ):
 	embeddings = [chunk.embedding for chunk in chunks]
-	buckets, planes, validIndices = _buildAnnIndex(
+	buckets, signatures, validIndices = _buildAnnIndex(
 		embeddings,
 		numTables=ANN_TABLES,
 		numPlanes=ANN_PLANES,
 		seed=ANN_SEED,
 	)
-	if not planes:
+	if not validIndices:
 		return
 
+	relations = []
 	for idx, chunk in enumerate(chunks):
 		if embeddings[idx] is None or idx not in validIndices:
 			continue
 
-		candidates = _getAnnCandidates(idx, embeddings, buckets, planes)
+		candidates = _getAnnCandidates(idx, buckets, signatures)
 		if not candidates:
 			continue
 
@@ -180,27 +212,43 @@ def _addRelatedChunkEdgesAnn(
 			score = _cosineSimilarity(embeddings[idx], embeddings[otherIdx])
 			sims.append((otherIdx, score))
 
-		_addRelatedCandidates(graph, chunk, chunks, sims, relatedTopK, relatedThreshold, llm)
+		relations.extend(_selectRelated(chunk, chunks, sims, relatedTopK, relatedThreshold))
 
+	_addRelationEdges(graph, relations, llm, relationCache)
 
-# Creates related_to edges from scored candidates
-def _addRelatedCandidates(
-	graph: IngestionGraph,
+
+# Picks the top-scoring candidates above the threshold as (chunk, other, score)
+def _selectRelated(
 	chunk: Chunk,
 	chunks: List[Chunk],
 	sims: List[Tuple[int, float]],
 	relatedTopK: int,
 	relatedThreshold: float,
+) -> List[Tuple[Chunk, Chunk, float]]:
+	if not sims:
+		return []
+	# Stable descending order on a float array (ties keep candidate order, as before)
+	scores = np.fromiter((score for _, score in sims), dtype=np.float64, count=len(sims))
+	top = np.argsort(-scores, kind='stable')[:relatedTopK]
+	return [
+		(chunk, chunks[sims[pos][0]], sims[pos][1])
+		for pos in top
+		if sims[pos][1] >= relatedThreshold
+	]
+
+
+# Creates related_to edges; all descriptions are requested before any is awaited
+def _addRelationEdges(
+	graph: IngestionGraph,
+	relations: List[Tuple[Chunk, Chunk, float]],
 	llm: Optional[LLM],
+	relationCache: Optional[SemanticCache] = None,
 ):
-	sims.sort(key=lambda item: item[1], reverse=True)
-	for otherIdx, score in sims[:relatedTopK]:
-		if score < relatedThreshold:
-			continue
-		description = _describeRelation(chunk, chunks[otherIdx], score, llm)
+	descriptions = _describeRelations(relations, llm, relationCache)
+	for (chunk, other, score), description in zip(relations, descriptions):
 		graph.addEdge(GraphEdge(
 			from_id=chunk.id,
-			to_id=chunks[otherIdx].id,
+			to_id=other.id,
 			type="related_to",
 			evidence="semantic_similarity",
 			description=description,
@@ -209,16 +257,18 @@ def _addRelatedCandidates(
 		))
 
 
-# Builds ANN buckets for cosine similarity using random hyperplanes
+# Builds ANN buckets for cosine similarity using random hyperplanes. Every valid
+# vector is hashed once here (one projection per table); queries reuse the stored
+# signatures instead of re-hashing.
 def _buildAnnIndex(
 	embeddings: List[Optional[List[float]]],
 	numTables: int,
 	numPlanes: int,
 	seed: int,
-) -> Tuple[List[Dict[int, List[int]]], List[np.ndarray], Set[int]]:
+) -> Tuple[List[Dict[int, List[int]]], Dict[int, List[int]], Set[int]]:
 	validIndices = [idx for idx, emb in enumerate(embeddings) if emb is not None]
 	if not validIndices:
-		return [], [], set()
+		return [], {}, set()
 
 	dimension = len(embeddings[validIndices[0]])
 	rng = np.random.RandomState(seed)
@@ -226,43 +276,35 @@ def _buildAnnIndex(
 		rng.normal(size=(numPlanes, dimension)).astype(np.float32)
 		for _ in range(numTables)
 	]
-	buckets = [defaultdict(list) for _ in range(numTables)]
+	vectors = np.array([embeddings[idx] for idx in validIndices], dtype=np.float32)
+	# Bit k of a signature is plane k's side, first plane most significant
+	weights = 1 << np.arange(numPlanes - 1, -1, -1, dtype=np.int64)
+	tableSignatures = [((vectors @ plane.T) >= 0) @ weights for plane in planes]
 
-	for idx in validIndices:
-		vector = np.array(embeddings[idx], dtype=np.float32)
-		for tableIdx, plane in enumerate(planes):
-			signature = _hashSignature(plane, vector)
+	buckets = [defaultdict(list) for _ in range(numTables)]
+	signatures = {}
+	for row, idx in enumerate(validIndices):
+		signatures[idx] = [int(tableSigs[row]) for tableSigs in tableSignatures]
+		for tableIdx, signature in enumerate(signatures[idx]):
 			buckets[tableIdx][signature].append(idx)
 
-	return buckets, planes, set(validIndices)
+	return buckets, signatures, set(validIndices)
 
 
 # Returns ANN candidates from matching buckets
 def _getAnnCandidates(
 	idx: int,
-	embeddings: List[Optional[List[float]]],
 	buckets: List[Dict[int, List[int]]],
-	planes: List[np.ndarray],
+	signatures: Dict[int, List[int]],
 ) -> Set[int]:
-	vector = np.array(embeddings[idx], dtype=np.float32)
 	candidates = set()
-	for tableIdx, plane in enumerate(planes):
-		signature = _hashSignature(plane, vector)
+	for tableIdx, signature in enumerate(signatures[idx]):
 		candidates.update(buckets[tableIdx].get(signature, []))
 
 	candidates.discard(idx)
 	return candidates
 
 
-# Hashes a vector against hyperplanes
-def _hashSignature(planes: np.ndarray, vector: np.ndarray) -> int:
-	projections = planes @ vector
-	signature = 0
-	for value in projections:
-		signature = (signature << 1) | (1 if value >= 0 else 0)
-	return signature
-
-
 def _cosineSimilarity(vecA: List[float], vecB: List[float]) -> float:
 	arrA = np.array(vecA, dtype=np.float32)
 	arrB = np.array(vecB, dtype=np.float32)
@@ -272,23 +314,95 @@ def _cosineSimilarity(vecA: List[float], vecB: List[float]) -> float:
 	return float(np.dot(arrA, arrB) / denom)
 
 
-def _describeRelation(chunkA: Chunk, chunkB: Chunk, score: float, llm: Optional[LLM]) -> str:
+# One description per relation. Requests go to the LLM worker pool together and are
+# collected afterwards; cached pairs, and the reverse direction of a pair already in
+# flight, reuse that description instead of another call.
+def _describeRelations(
+	relations: List[Tuple[Chunk, Chunk, float]],
+	llm: Optional[LLM],
+	relationCache: Optional[SemanticCache] = None,
+) -> List[str]:
+	descriptions: List[Optional[str]] = [None] * len(relations)
 	if llm is None:
-		return f"Semantic similarity score {score:.2f} between chunks."
+		return [_fallbackDescription(score) for _, _, score in relations]
+
+	pending, shared, keys = _requestRelations(relations, llm, relationCache, descriptions)
+
+	# Collect only after every request is submitted
+	for slot, future in pending.items():
+		try:
+			descriptions[slot] = future.result().strip()
+		except Exception:
+			continue
+		if keys[slot] is not None:
+			relationCache.insert(keys[slot], descriptions[slot])
+	for slot, owner in shared.items():
+		descriptions[slot] = descriptions[owner]
+
+	return [
+		description if description is not None else _fallbackDescription(score)
+		for description, (_, _, score) in zip(descriptions, relations)
+	]
 
-	prompt = (
+
+# Fills cache hits into descriptions and submits the rest; returns the in-flight
+# futures by slot, slots sharing another slot's request, and each slot's cache key
+def _requestRelations(
+	relations: List[Tuple[Chunk, Chunk, float]],
+	llm: LLM,
+	relationCache: Optional[SemanticCache],
+	descriptions: List[Optional[str]],
+):
+	pending, shared, keys = {}, {}, [None] * len(relations)
+	# In-flight requests are shared only by the same pair (either direction)
+	inflight: Dict[Tuple[str, str], int] = {}
+	for slot, (chunkA, chunkB, _) in enumerate(relations):
+		key = _relationKey(chunkA, chunkB) if relationCache is not None else None
+		if key is not None:
+			cached = relationCache.lookup(key, threshold=RELATION_REUSE_THRESHOLD)
+			if cached is not None:
+				descriptions[slot] = cached
+				continue
+		pairId = (chunkA.id, chunkB.id) if chunkA.id <= chunkB.id else (chunkB.id, chunkA.id)
+		if pairId in inflight:
+			shared[slot] = inflight[pairId]
+			continue
+		inflight[pairId] = slot
+		keys[slot] = key
+		pending[slot] = llm.chatAsync(
+			messages=[{"role": "user", "content": _relationPrompt(chunkA, chunkB)}],
+			model="gpt-4o-mini",
+		)
+	return pending, shared, keys
+
+
+def _relationPrompt(chunkA: Chunk, chunkB: Chunk) -> str:
+	return (
 		"Write one concise sentence describing how the two chunks are related.\n\n"
 		f"Chunk A:\n{_formatPropositions(chunkA.data)}\n\n"
 		f"Chunk B:\n{_formatPropositions(chunkB.data)}\n"
 	)
-	try:
-		response = llm.chat(
-			messages=[{"role": "user", "content": prompt}],
-			model="gpt-4o-mini",
-		)
-		return response.strip()
-	except Exception:
-		return f"Semantic similarity score {score:.2f} between chunks."
+
+
+def _fallbackDescription(score: float) -> str:
+	return f"Semantic similarity score {score:.2f} between chunks."
+
+
+# Order-independent key for a chunk pair: both unit embeddings, concatenated by id
+# order. Its cosine with another pair's key is the mean of the two chunk cosines, so
+# (A, B) vs (A, C) scores (1 + cos(B, C)) / 2: look it up with RELATION_REUSE_THRESHOLD.
+def _relationKey(chunkA: Chunk, chunkB: Chunk) -> Optional[np.ndarray]:
+	if chunkA.embedding is None or chunkB.embedding is None:
+		return None
+	first, second = (chunkA, chunkB) if chunkA.id <= chunkB.id else (chunkB, chunkA)
+	parts = []
+	for embedding in (first.embedding, second.embedding):
+		vector = np.asarray(embedding, dtype=np.float32)
+		norm = float(np.linalg.norm(vector))
+		if norm == 0.0:
+			return None
+		parts.append(vector / norm)
+	return np.concatenate(parts)
 
 
 def _formatPropositions(propositions: List[str]) -> str:
@@ -0,0 +1,132 @@
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.services.ingester.services.Embedder import Embedder
+
+SEMANTIC_CACHE_THRESHOLD = 0.87
+SEMANTIC_CACHE_MAX_ENTRIES = 2000
+
+# --- Classes ------------------------------------------------------------
+
+class SemanticCache:
+	# Response cache keyed by embeddings: a lookup hits when a stored key has cosine
+	# similarity >= threshold with the query. Keys are L2-normalized and stored as
+	# int8 codes with a per-key scale (4x smaller than float32), so a lookup is one
+	# int32-accumulated matrix-vector product; the least recently used entry is evicted.
+
+	def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+				 maxEntries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+				 cachePath: Optional[str] = None):
+		self.threshold = threshold
+		self.maxEntries = maxEntries
+		self.cachePath = Path(cachePath) if cachePath else None
+		self.lock = threading.Lock()
+
+		self.codes: Optional[np.ndarray] = None  # (maxEntries, dim) int8, allocated on first insert
+		self.scales = np.zeros(maxEntries, dtype=np.float32)
+		self.values = []
+		self.lastUsed = np.zeros(maxEntries, dtype=np.int64)
+		self.clock = 0
+		self.hits = 0
+		self.misses = 0
+		self._load()
+
+	# Stored response for the nearest key, or None below the threshold; callers can
+	# raise (never lower) the bar for a single lookup
+	def lookup(self, vector, threshold: Optional[float] = None) -> Optional[str]:
+		threshold = self.threshold if threshold is None else max(threshold, self.threshold)
+		query = self._normalize(vector)
+		if query is None:
+			return None
+		with self.lock:
+			size = len(self.values)
+			if size == 0 or self.codes.shape[1] != query.shape[0]:
+				self.misses += 1
+				return None
+			queryCodes, queryScale = Embedder.quantize(query)
+			sims = Embedder.quantizedSimilarityBatch(
+				queryCodes, queryScale, self.codes[:size], self.scales[:size],
+			)
+			best = int(np.argmax(sims))
+			if sims[best] < threshold:
+				self.misses += 1
+				return None
+			self.clock += 1
+			self.lastUsed[best] = self.clock
+			self.hits += 1
+			return self.values[best]
+
+	def insert(self, vector, value: str) -> None:
+		key = self._normalize(vector)
+		if key is None:
+			return
+		with self.lock:
+			if self.codes is None or self.codes.shape[1] != key.shape[0]:
+				self.codes = np.zeros((self.maxEntries, key.shape[0]), dtype=np.int8)
+				self.values = []
+			size = len(self.values)
+			if size < self.maxEntries:
+				slot = size
+				self.values.append(value)
+			else:
+				slot = int(np.argmin(self.lastUsed))
+				self.values[slot] = value
+			self.codes[slot], self.scales[slot] = Embedder.quantize(key)
+			self.clock += 1
+			self.lastUsed[slot] = self.clock
+
+	# Write entries to cachePath (no-op without one)
+	def save(self) -> None:
+		if self.cachePath is None:
+			return
+		with self.lock:
+			size = len(self.values)
+			if size == 0:
+				return
+			codes = self.codes[:size].copy()
+			scales = self.scales[:size].copy()
+			values = np.array(self.values, dtype=str)
+			lastUsed = self.lastUsed[:size].copy()
+		self.cachePath.parent.mkdir(parents=True, exist_ok=True)
+		tmpPath = self.cachePath.with_name(self.cachePath.name + ".tmp")
+		with open(tmpPath, 'wb') as f:
+			np.savez(f, codes=codes, scales=scales, values=values, lastUsed=lastUsed)
+		tmpPath.replace(self.cachePath)
+
+	def _load(self) -> None:
+		if self.cachePath is None or not self.cachePath.exists():
+			return
+		try:
+			with np.load(self.cachePath, allow_pickle=False) as data:
+				codes, scales = data["codes"], data["scales"]
+				values, lastUsed = data["values"], data["lastUsed"]
+		except Exception as e:
+			print(f"⚠️  Could not load semantic cache {self.cachePath}: {e}")
+			return
+		keep = np.argsort(lastUsed)[-self.maxEntries:]  # most recently used survive
+		self.codes = np.zeros((self.maxEntries, codes.shape[1]), dtype=np.int8)
+		self.codes[:len(keep)] = codes[keep]
+		self.scales[:len(keep)] = scales[keep]
+		self.values = [str(v) for v in values[keep]]
+		self.lastUsed[:len(keep)] = np.arange(1, len(keep) + 1)
+		self.clock = len(keep)
+
+	@staticmethod
+	def _normalize(vector) -> Optional[np.ndarray]:
+		if vector is None:
+			return None
+		arr = np.asarray(vector, dtype=np.float32).ravel()
+		norm = float(np.linalg.norm(arr))
+		if arr.size == 0 or norm == 0.0:
+			return None
+		return arr / norm
+
+	def stats(self):
+		return {
+			'entries': len(self.values),
+			'hits': self.hits,
+			'misses': self.misses,
+		}
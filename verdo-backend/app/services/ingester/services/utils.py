@@ -0,0 +1,25 @@
+import json
+
+try:
+	import orjson
+except Exception:
+	orjson = None
+
+# --- Helpers ------------------------------------------------------------
+
+# JSON through orjson (C parser/serializer) when installed, stdlib json otherwise.
+# Both paths emit compact, non-ASCII-escaped UTF-8 so outputs match either way.
+def loadsJson(data):
+	if orjson is not None:
+		return orjson.loads(data)
+	return json.loads(data)
+
+
+def dumpsJsonBytes(obj) -> bytes:
+	if orjson is not None:
+		return orjson.dumps(obj)
+	return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumpsJson(obj) -> str:
+	return dumpsJsonBytes(obj).decode('utf-8')
@@ -3,6 +3,16 @@ import os
 import sys
 from pathlib import Path
 
+try:
+	import ijson
+except Exception:
+	ijson = None
+
+try:
+	import orjson
+except Exception:
+	orjson = None
+
 # --- Setup --------------------------------------------------------------
 
 # Resolve project root (expects 'app' dir present up the tree)
@@ -29,6 +39,17 @@ except ImportError:
 	from app.services.ingester.services.chunker import Chunker
 	from app.services.ingester.services.ingestion_graph import buildGraph
 
+# --- Helpers ------------------------------------------------------------
+
+# Yield the document's pages; with ijson only one page is parsed into memory at a time
+def iterPages(inputFile):
+	with open(inputFile, 'rb') as f:
+		if ijson is not None:
+			yield from ijson.items(f, 'item', use_float=True)
+			return
+		raw = f.read()
+	yield from (orjson.loads(raw) if orjson is not None else json.loads(raw))
+
 # --- Main ---------------------------------------------------------------
 
 def main():
@@ -41,25 +62,13 @@ def main():
 		return
 
 	print(f"Loading {inputFile}...")
-	with open(inputFile, 'r', encoding='utf-8') as f:
-		data = json.load(f)
-
-	# Extract propositions (content from elements)
-	propositions = []
-	for page in data:
-		for element in page.get('elements', []):
-			content = str(element.get('content', '')).strip()
-			if content:
-				propositions.append(content)
-
-	print(f"Extracted {len(propositions)} propositions.")
 
 	# Initialize Chunker
 	chunker = Chunker()
 
-	# Run Chunker
+	# Run Chunker (pages are streamed straight into getElements)
 	print("Running AgenticChunker...")
-	chunker.getElements(data)
+	chunker.getElements(iterPages(inputFile))
 	print(f"Extracted {len(chunker.elements)} elements.")
 
 	chunker.batch(threshold=1000)
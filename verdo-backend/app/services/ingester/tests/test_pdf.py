@@ -4,6 +4,11 @@ import os
 import sys
 from pathlib import Path
 
+try:
+	import orjson
+except Exception:
+	orjson = None
+
 # Resolve project root (expects 'app' dir present up the tree)
 PROJECT_ROOT = Path(__file__).resolve()
 for _ in range(8):
@@ -42,8 +47,13 @@ def main():
 
 	data = router.process(str(pdfPath))
 
-	with open(outPath, "w", encoding="utf-8") as f:
-		json.dump(data, f, ensure_ascii=False, indent=2)
+	# orjson writes UTF-8 bytes directly (same 2-space layout as json.dump)
+	if orjson is not None:
+		with open(outPath, "wb") as f:
+			f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+	else:
+		with open(outPath, "w", encoding="utf-8") as f:
+			json.dump(data, f, ensure_ascii=False, indent=2)
 
 	print(f"Wrote: {outPath}")
 
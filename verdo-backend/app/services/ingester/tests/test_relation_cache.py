@@ -0,0 +1,103 @@
+import math
+import sys
+import tempfile
+from concurrent.futures import Future
+from pathlib import Path
+
+# Resolve project root (expects 'app' dir present up the tree)
+PROJECT_ROOT = Path(__file__).resolve()
+for _ in range(8):
+	if (PROJECT_ROOT / 'app').exists():
+		break
+	PROJECT_ROOT = PROJECT_ROOT.parent
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from app.services.ingester.services.chunk import Chunk
+from app.services.ingester.services.ingestion_graph import buildGraph
+from app.services.ingester.services.semantic_cache import SemanticCache
+
+# --- Helpers ------------------------------------------------------------
+
+class FakeLLM:
+	# Answers each relation prompt with the propositions it was asked about, so an
+	# edge's description shows which pair it was generated for
+	def __init__(self):
+		self.calls = 0
+
+	def chatAsync(self, messages, model=None, **options):
+		self.calls += 1
+		props = sorted(line[2:] for line in messages[0]["content"].splitlines() if line.startswith("- "))
+		future = Future()
+		future.set_result(" & ".join(props))
+		return future
+
+# A is related to both B and C (cos 0.94), while cos(B, C) = 0.77: a pair key
+# (A, B) vs (A, C) scores 0.88, above the default 0.87 cache threshold
+def makeChunks():
+	angle = math.radians(20)
+	embeddings = {
+		"a": [1.0, 0.0, 0.0, 0.0],
+		"b": [math.cos(angle), math.sin(angle), 0.0, 0.0],
+		"c": [math.cos(angle), -math.sin(angle), 0.0, 0.0],
+	}
+	return [Chunk(chunkId, [chunkId.upper()], embedding=emb) for chunkId, emb in embeddings.items()]
+
+def relatedDescriptions(graph):
+	return {
+		(edge.from_id, edge.to_id): edge.description
+		for edge in graph.edges
+		if edge.type == "related_to"
+	}
+
+def expectedDescription(fromId, toId):
+	return " & ".join(sorted([fromId.upper(), toId.upper()]))
+
+# --- Tests --------------------------------------------------------------
+
+# A cached (A, B) description must not be handed to A->C in a later build
+def test_cached_pairs_keep_own_description():
+	cache = SemanticCache()
+	chunks = makeChunks()
+	buildGraph(chunks[:2], {}, llm=FakeLLM(), relationCache=cache)
+
+	llm = FakeLLM()
+	descriptions = relatedDescriptions(buildGraph(chunks, {}, llm=llm, relationCache=cache))
+	assert set(descriptions) == {("a", "b"), ("a", "c"), ("b", "a"), ("c", "a")}
+	for (fromId, toId), description in descriptions.items():
+		assert description == expectedDescription(fromId, toId), (fromId, toId, description)
+	# Only A-C is new: A-B and both reverse directions are reused
+	assert llm.calls == 1
+
+# Within one build, A->C must not share the request in flight for A->B
+def test_inflight_pairs_keep_own_description():
+	llm = FakeLLM()
+	descriptions = relatedDescriptions(buildGraph(makeChunks(), {}, llm=llm, relationCache=SemanticCache()))
+	assert set(descriptions) == {("a", "b"), ("a", "c"), ("b", "a"), ("c", "a")}
+	for (fromId, toId), description in descriptions.items():
+		assert description == expectedDescription(fromId, toId), (fromId, toId, description)
+	# One request per pair; the reverse directions share it
+	assert llm.calls == 2
+
+# A second build of the same chunks is answered from the saved cache file
+def test_relation_cache_persists():
+	cachePath = Path(tempfile.mkdtemp()) / "relations.npz"
+	buildGraph(makeChunks(), {}, llm=FakeLLM(), relationCache=SemanticCache(cachePath=str(cachePath)))
+	assert cachePath.exists()
+
+	llm = FakeLLM()
+	graph = buildGraph(makeChunks(), {}, llm=llm, relationCache=SemanticCache(cachePath=str(cachePath)))
+	assert llm.calls == 0
+	for (fromId, toId), description in relatedDescriptions(graph).items():
+		assert description == expectedDescription(fromId, toId), (fromId, toId, description)
+
+# --- Main ---------------------------------------------------------------
+
+def main():
+	for name, test in list(globals().items()):
+		if name.startswith("test_") and callable(test):
+			test()
+			print(f"✅ {name}")
+
+if __name__ == "__main__":
+	main()
@@ -1,68 +1,290 @@
-﻿import base64
+﻿import atexit
+import binascii
 import io
 import json
 import hashlib
+import logging
 import os
-import requests
+import sqlite3
+import struct
+import sys
+import threading
+import weakref
+import zlib
 import fitz
+import httpx
 from PIL import Image
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Dict, Any
-from concurrent.futures import Future
+from typing import Optional, Dict, Any, List
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from blake3 import blake3
+except Exception:
+    blake3 = None
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+try:
+    import h2  # enables HTTP/2 in httpx
+except Exception:
+    h2 = None
+
+try:
+    import zstandard
+except Exception:
+    zstandard = None
+
+CACHE_SAVE_DELAY = 2.0  # seconds to coalesce cache writes into one save
+HASH_HEX_CHARS = 32  # cache keys only need to be unique, not collision-resistant
+BLAKE3_THREADED_BYTES = 1 << 20  # blobs this large hash on BLAKE3's thread pool
+HASH_BATCH_MIN = 4  # smaller batches are hashed inline
+IMAGE_URL_SLOT = '"__IMAGE_URL__"'  # JSON placeholder replaced by the data URL in request bodies
+VISION_MIME_TYPES = frozenset(("image/png", "image/jpeg", "image/gif", "image/webp"))
+HTTP_MAX_CONNECTIONS = 64
+HTTP_MAX_KEEPALIVE = 32
+VISION_MAX_SIDE = 1536  # larger images are downscaled before upload
+VISION_JPEG_QUALITY = 85
+PHOTO_MIN_COLORS = 256  # more distinct colors than this is treated as a photo
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PDF_RENDER_ZOOM = 2.0  # 2x zoom for better quality
+STRIP_RENDER_MIN_BYTES = 16 << 20  # larger renders are done in horizontal strips
+STRIP_BYTES = 2 << 20  # target raw size of one strip
+PART_CACHE_SIZE = 4096  # image parts remembered per open presentation
+ZSTD_DICT_KEY = "dict_v1"
+ZSTD_DICT_SIZE = 16384
+ZSTD_TRAIN_MIN = 256  # plain-text descriptions needed before training a dictionary
+
+# Per-image progress goes through logging: %-args are only formatted when a
+# handler consumes the record, and nothing is built when DEBUG is off
+log = logging.getLogger(__name__)
 
 class ImageCache:
-    # Simple file-based cache for image descriptions.
+    # Image descriptions in SQLite, keyed by the raw digest bytes: get/set/has are
+    # single indexed statements and nothing is loaded into memory up front.
+    # With blake3 installed, keys are truncated BLAKE3 digests; SHA-256 entries
+    # (in the table or the old descriptions.json) are found once per image and migrated.
+    # Writes are committed in batches: the first set() after a commit arms a
+    # saveDelay timer and an exit hook, and flush() commits immediately and disarms
+    # both, so an idle cache holds no thread or hook and can be collected.
+    # With zstandard installed, descriptions are stored as zstd frames compressed
+    # against a dictionary trained once from the first ZSTD_TRAIN_MIN entries
+    # (kept in the meta table); rows written before that stay plain TEXT. Once a
+    # dictionary exists the cache cannot be read without zstandard, so opening it
+    # then fails instead of paying again for every compressed description.
     
-    def __init__(self, cacheDir: str = "./cache/images"):
+    def __init__(self, cacheDir: str = "./cache/images", saveDelay: float = CACHE_SAVE_DELAY):
         # Initialize image cache.
         self.cacheDir = Path(cacheDir)
         self.cacheDir.mkdir(parents=True, exist_ok=True)
-        self.cacheFile = self.cacheDir / "descriptions.json"
-        self.cache = self._loadCache()
+        self.legacyFile = self.cacheDir / "descriptions.json"
+        jsonFile = self.cacheDir / "descriptions_b3.json" if blake3 is not None else self.legacyFile
+        self.cacheFile = self.cacheDir / "descriptions.db"
+        isNew = not self.cacheFile.exists()
+        self.conn = sqlite3.connect(str(self.cacheFile), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions "
+            "(h BLOB PRIMARY KEY, d TEXT) WITHOUT ROWID"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v BLOB)")
+        if isNew:
+            self._importJson(jsonFile)
+        self.compressor = None
+        self.decompressor = None
+        self.trainAt = ZSTD_TRAIN_MIN
+        self.plainRows = 0  # plain-text rows written since the last count, for training
+        self._loadDictionary()
+        self.legacyCache: Optional[Dict[str, str]] = None  # loaded on first migration lookup
+        self.hashPool: Optional[ThreadPoolExecutor] = None  # created on first batch hash
+        
+        # Batched commits
+        self.saveDelay = saveDelay
+        self.dirty = False
+        self.cacheLock = threading.Lock()  # one user of the connection at a time
+        self.saveTimer: Optional[threading.Timer] = None
+        self.exitHooked = False
     
-    def _loadCache(self) -> Dict[str, str]:
-        # Load cache from disk.
-        if self.cacheFile.exists():
+    def _loadJson(self, jsonFile: Path) -> Dict[str, str]:
+        # Load a JSON cache file from before the SQLite store.
+        if jsonFile.exists():
             try:
-                with open(self.cacheFile, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(jsonFile, 'rb') as f:
+                    data = f.read()
+                return orjson.loads(data) if orjson is not None else json.loads(data)
             except Exception:
                 return {}
         return {}
     
-    def _saveCache(self) -> None:
-        # Save cache to disk.
+    def _importJson(self, jsonFile: Path) -> None:
+        # Seed a new database with the entries of the JSON cache it replaces.
+        rows = []
+        for imageHash, description in self._loadJson(jsonFile).items():
+            try:
+                rows.append((bytes.fromhex(imageHash), description))
+            except ValueError:
+                continue
+        if rows:
+            self.conn.executemany("INSERT OR REPLACE INTO descriptions (h, d) VALUES (?, ?)", rows)
+            self.conn.commit()
+    
+    def _loadDictionary(self) -> None:
+        # Pick up a previously trained dictionary, if any.
+        row = self.conn.execute("SELECT v FROM meta WHERE k = ?", (ZSTD_DICT_KEY,)).fetchone()
+        if row and zstandard is None:
+            raise RuntimeError(
+                f"Image cache {self.cacheFile} stores zstd-compressed descriptions; "
+                "install zstandard to read it"
+            )
+        if row:
+            self._useDictionary(bytes(row[0]))
+        elif zstandard is not None:
+            self.plainRows = self.conn.execute(
+                "SELECT count(*) FROM descriptions WHERE typeof(d) = 'text'"
+            ).fetchone()[0]
+    
+    def _useDictionary(self, data: bytes) -> None:
+        dictionary = zstandard.ZstdCompressionDict(data)
+        self.compressor = zstandard.ZstdCompressor(dict_data=dictionary)
+        self.decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+    
+    def _trainDictionary(self) -> None:
+        # Once enough plain descriptions exist, train a dictionary on them and
+        # recompress those rows (caller holds cacheLock). plainRows counts writes,
+        # so rows are only read once it reaches trainAt.
+        if self.plainRows < self.trainAt:
+            return
+        rows = self.conn.execute("SELECT h, d FROM descriptions WHERE typeof(d) = 'text'").fetchall()
+        self.plainRows = len(rows)  # replaced keys were counted twice
+        if len(rows) < self.trainAt:
+            return
         try:
-            with open(self.cacheFile, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"âš ï¸  Could not save cache: {e}")
+            trained = zstandard.train_dictionary(ZSTD_DICT_SIZE, [d.encode('utf-8') for _, d in rows])
+        except Exception:
+            self.trainAt = len(rows) + ZSTD_TRAIN_MIN  # too little material; retry with more
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (k, v) VALUES (?, ?)",
+            (ZSTD_DICT_KEY, trained.as_bytes())
+        )
+        self._useDictionary(trained.as_bytes())
+        self.conn.executemany(
+            "UPDATE descriptions SET d = ? WHERE h = ?",
+            [(self._encode(d), h) for h, d in rows]
+        )
+    
+    def _encode(self, description: str):
+        if self.compressor is None:
+            return description
+        return self.compressor.compress(description.encode('utf-8'))
+    
+    def _decode(self, value) -> str:
+        if not isinstance(value, bytes):
+            return value
+        return self.decompressor.decompress(value).decode('utf-8')
+    
+    def _markDirty(self) -> None:
+        # Schedule a commit for the pending write (caller holds cacheLock).
+        self.dirty = True
+        if self.saveTimer is None:
+            self.saveTimer = threading.Timer(self.saveDelay, self.flush)
+            self.saveTimer.daemon = True
+            self.saveTimer.start()
+        if not self.exitHooked:
+            atexit.register(self.flush)
+            self.exitHooked = True
+    
+    def flush(self) -> None:
+        # Commit pending entries now (also run by the timer and at exit).
+        with self.cacheLock:
+            if self.saveTimer is not None:
+                self.saveTimer.cancel()
+                self.saveTimer = None
+            if not self.dirty:
+                return
+            try:
+                if zstandard is not None and self.compressor is None:
+                    self._trainDictionary()
+                self.conn.commit()
+                self.dirty = False
+                atexit.unregister(self.flush)
+                self.exitHooked = False
+            except Exception as e:
+                print(f"âš ï¸  Could not save cache: {e}")
     
     def getImageHash(self, imageBytes: bytes) -> str:
-        # Generate hash for image bytes.
-        return hashlib.sha256(imageBytes).hexdigest()
+        # Generate hash for image bytes (BLAKE3 when installed, else SHA-256).
+        if blake3 is None:
+            return hashlib.sha256(imageBytes).hexdigest()
+        threads = blake3.AUTO if len(imageBytes) >= BLAKE3_THREADED_BYTES else 1
+        return blake3(imageBytes, max_threads=threads).hexdigest()[:HASH_HEX_CHARS]
+    
+    def getImageHashesBatch(self, blobs: List[bytes]) -> List[str]:
+        # Hash many independent blobs at once. hashlib and blake3 release the GIL
+        # while hashing, so the blobs spread across cores.
+        if len(blobs) < HASH_BATCH_MIN:
+            return [self.getImageHash(blob) for blob in blobs]
+        if self.hashPool is None:
+            self.hashPool = ThreadPoolExecutor(max_workers=min(16, os.cpu_count() or 1))
+        return list(self.hashPool.map(self.getImageHash, blobs))
     
     def get(self, imageHash: str) -> Optional[str]:
         # Get cached description for image hash.
-        return self.cache.get(imageHash)
+        with self.cacheLock:
+            row = self.conn.execute(
+                "SELECT d FROM descriptions WHERE h = ?", (bytes.fromhex(imageHash),)
+            ).fetchone()
+            return self._decode(row[0]) if row else None
+    
+    def migrate(self, imageHash: str, imageBytes: bytes) -> Optional[str]:
+        # Look the image up under its old SHA-256 key and copy a hit to imageHash.
+        if blake3 is None:
+            return None
+        legacyHash = hashlib.sha256(imageBytes).hexdigest()
+        description = self.get(legacyHash)
+        if description is None:
+            if self.legacyCache is None:
+                self.legacyCache = self._loadJson(self.legacyFile)
+            description = self.legacyCache.pop(legacyHash, None)
+        if description is not None:
+            self.set(imageHash, description)
+        return description
     
     def set(self, imageHash: str, description: str) -> None:
-        # Cache description for image hash.
-        self.cache[imageHash] = description
-        self._saveCache()
+        # Cache description for image hash; committed by the background saver.
+        with self.cacheLock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO descriptions (h, d) VALUES (?, ?)",
+                (bytes.fromhex(imageHash), self._encode(description))
+            )
+            if self.compressor is None:
+                self.plainRows += 1
+            self._markDirty()
     
     def has(self, imageHash: str) -> bool:
         # Check if image hash exists in cache.
-        return imageHash in self.cache
+        with self.cacheLock:
+            row = self.conn.execute(
+                "SELECT 1 FROM descriptions WHERE h = ?", (bytes.fromhex(imageHash),)
+            ).fetchone()
+        return row is not None
     
     def stats(self) -> Dict[str, int]:
-        # Get cache statistics.
+        # Get cache statistics (database plus its write-ahead log).
+        with self.cacheLock:
+            total = self.conn.execute("SELECT count(*) FROM descriptions").fetchone()[0]
+        walFile = self.cacheFile.with_name(self.cacheFile.name + "-wal")
+        sizeBytes = sum(f.stat().st_size for f in (self.cacheFile, walFile) if f.exists())
         return {
-            'total_cached': len(self.cache),
-            'cache_size_kb': self.cacheFile.stat().st_size // 1024 if self.cacheFile.exists() else 0
+            'total_cached': total,
+            'cache_size_kb': sizeBytes // 1024
         }
 
-
 class ImageHandler:
     # Handles image extraction and description generation using OpenAI Vision API.
     
@@ -76,6 +298,26 @@ class ImageHandler:
         self.llm = llmClient  # Use LLM's thread pool for parallel execution
         self.model = model
         self.verbose = verbose
+        if verbose and not log.handlers:
+            # verbose keeps the old console progress output; not propagated, so an
+            # app that configures root logging doesn't print every line twice
+            consoleHandler = logging.StreamHandler(sys.stdout)
+            consoleHandler.setFormatter(logging.Formatter("%(message)s"))
+            log.addHandler(consoleHandler)
+            log.setLevel(logging.DEBUG)
+            log.propagate = False
+        
+        # One client for every API call: connections stay open between requests
+        # (multiplexed over HTTP/2 when h2 is installed) instead of a new TLS
+        # handshake per image
+        self.httpClient = httpx.Client(
+            http2=h2 is not None,
+            limits=httpx.Limits(
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+                max_connections=HTTP_MAX_CONNECTIONS,
+            ),
+            timeout=30.0,
+        )
         
         # Initialize cache
         self.enableCache = enableCache
@@ -87,58 +329,37 @@ class ImageHandler:
         else:
             self.cache = None
         
-        # Track API usage
+        # Track API usage (incremented from worker threads, so under statsLock)
         self.apiCallCount = 0
         self.cacheHitCount = 0
+        self.statsLock = threading.Lock()
+        
+        # Requests in flight per image hash, so duplicates share one API call
+        self.inflight: Dict[str, Future] = {}
+        self.inflightLock = threading.Lock()
+        
+        # Description futures per presentation and image part, so a picture reused
+        # across slides (logos, headers) is answered before its blob is read or hashed
+        self.partDescriptions = weakref.WeakKeyDictionary()
+        self.partLock = threading.Lock()
     
     def handlePptxAsync(self, shape, context: Optional[str] = None):
         # Process PPTX image asynchronously - returns future.
         try:
+            partKey = pptxImagePart(shape) if self.enableCache else None
+            if partKey is not None:
+                future = self._partDescription(*partKey)
+                if future is not None:
+                    return future
+            
             # Extract image bytes
             image = shape.image
             imageBytes = image.blob
+            mimeType = image.content_type  # sent as-is when the vision API accepts it
             
-            # Check cache first
-            if self.enableCache:
-                imageHash = self.cache.getImageHash(imageBytes)
-                cachedDesc = self.cache.get(imageHash)
-                if cachedDesc:
-                    self.cacheHitCount += 1
-                    if self.verbose:
-                        print(f"  âœ“ Cached description (hit #{self.cacheHitCount})")
-                    # Return a completed future with cached result
-                    future = Future()
-                    future.set_result(cachedDesc)
-                    return future
-            
-            # Convert to PIL Image
-            pilImage = Image.open(io.BytesIO(imageBytes))
-            
-            # Generate description asynchronously
-            self.apiCallCount += 1
-            if self.verbose:
-                print(f"  â†’ API call #{self.apiCallCount} (generating description)...")
-            
-            future = self._generateDescriptionAsync(pilImage, context)
-            
-            # Wrap future to handle caching when result arrives
-            if self.enableCache:
-                imageHash = self.cache.getImageHash(imageBytes)
-                originalFuture = future
-                wrappedFuture = Future()
-                
-                def cacheResult():
-                    try:
-                        result = originalFuture.result()
-                        self.cache.set(imageHash, result)
-                        wrappedFuture.set_result(result)
-                    except Exception as e:
-                        wrappedFuture.set_exception(e)
-                
-                # Submit caching task to run after description completes
-                self.llm.submit(cacheResult)
-                return wrappedFuture
-            
+            future = self._describeAsync(imageBytes, mimeType, context)
+            if partKey is not None:
+                self._rememberPart(partKey[0], partKey[1], future)
             return future
             
         except Exception as e:
@@ -149,6 +370,36 @@ class ImageHandler:
             future.set_result(f"<ERROR: {str(e)}>")
             return future
     
+    def _partDescription(self, package, partName: str) -> Optional[Future]:
+        # Future already known for this image part of this presentation, if any
+        with self.partLock:
+            parts = self.partDescriptions.get(package)
+            future = parts.get(partName) if parts is not None else None
+            if future is None:
+                return None
+            parts.move_to_end(partName)
+        with self.statsLock:
+            self.cacheHitCount += 1
+            hitNumber = self.cacheHitCount
+        log.debug("  âœ“ Cached description (hit #%d)", hitNumber)
+        return future
+    
+    def _rememberPart(self, package, partName: str, future: Future) -> None:
+        with self.partLock:
+            parts = self.partDescriptions.setdefault(package, OrderedDict())
+            parts[partName] = future
+            if len(parts) > PART_CACHE_SIZE:
+                parts.popitem(last=False)
+        
+        # Failed requests are retried next time rather than replayed
+        def forgetFailure(done: Future):
+            if done.exception() is not None:
+                with self.partLock:
+                    parts = self.partDescriptions.get(package)
+                    if parts is not None and parts.get(partName) is done:
+                        del parts[partName]
+        future.add_done_callback(forgetFailure)
+    
     def handlePptx(self, shape, context: Optional[str] = None) -> str:
         # Extract image from PPTX shape and generate description (blocking).
         # Use async version and block on result
@@ -169,54 +420,10 @@ class ImageHandler:
             )
             
             # Render the region as an image at high resolution
-            mat = fitz.Matrix(2.0, 2.0)  # 2x zoom for better quality
-            pix = page.get_pixmap(matrix=mat, clip=scaledRect)
-            
-            # Convert to bytes
-            imageBytes = pix.tobytes("png")
-            
-            # Check cache first
-            if self.enableCache:
-                imageHash = self.cache.getImageHash(imageBytes)
-                cachedDesc = self.cache.get(imageHash)
-                if cachedDesc:
-                    self.cacheHitCount += 1
-                    if self.verbose:
-                        print(f"  âœ“ Cached description (hit #{self.cacheHitCount})")
-                    # Return completed future with cached result
-                    future = Future()
-                    future.set_result(cachedDesc)
-                    return future
-            
-            # Convert to PIL Image for API
-            pilImage = Image.open(io.BytesIO(imageBytes))
-            
-            # Generate description asynchronously
-            self.apiCallCount += 1
-            if self.verbose:
-                print(f"  â†’ API call #{self.apiCallCount} (generating description)...")
+            imageBytes = renderRegionPng(page, scaledRect, PDF_RENDER_ZOOM)
+            mimeType = "image/png"
             
-            future = self._generateDescriptionAsync(pilImage, context)
-            
-            # Wrap future to handle caching when result arrives
-            if self.enableCache:
-                imageHash = self.cache.getImageHash(imageBytes)
-                originalFuture = future
-                wrappedFuture = Future()
-                
-                def cacheResult():
-                    try:
-                        result = originalFuture.result()
-                        self.cache.set(imageHash, result)
-                        wrappedFuture.set_result(result)
-                    except Exception as e:
-                        wrappedFuture.set_exception(e)
-                
-                # Submit caching task to run after description completes
-                self.llm.submit(cacheResult)
-                return wrappedFuture
-            
-            return future
+            return self._describeAsync(imageBytes, mimeType, context)
             
         except Exception as e:
             if self.verbose:
@@ -233,26 +440,85 @@ class ImageHandler:
         future = self.handlePdfAsync(page, bbox, scale, context)
         return future.result()
     
-    def _generateDescriptionAsync(self, image: Image.Image, 
+    def _describeAsync(self, imageBytes: bytes, mimeType: str,
+                       context: Optional[str] = None) -> Future:
+        # Cached description, the pending request for the same image, or a new API call.
+        if not self.enableCache:
+            return self._requestDescription(imageBytes, mimeType, context)
+        
+        # Check cache first
+        imageHash = self.cache.getImageHash(imageBytes)
+        cachedDesc = self.cache.get(imageHash) or self.cache.migrate(imageHash, imageBytes)
+        if cachedDesc:
+            with self.statsLock:
+                self.cacheHitCount += 1
+                hitNumber = self.cacheHitCount
+            log.debug("  âœ“ Cached description (hit #%d)", hitNumber)
+            # Return a completed future with cached result
+            future = Future()
+            future.set_result(cachedDesc)
+            return future
+        
+        # Single-flight: a repeated image (logo, header) joins the request already
+        # running for it instead of paying for a second API call
+        with self.inflightLock:
+            pending = self.inflight.get(imageHash)
+            if pending is not None:
+                return pending
+            wrappedFuture = Future()
+            self.inflight[imageHash] = wrappedFuture
+        
+        originalFuture = self._requestDescription(imageBytes, mimeType, context)
+        
+        # Cache the result when it arrives. A done-callback runs on the thread that
+        # finished the request, so no pool worker is tied up waiting on it.
+        def cacheResult(done: Future):
+            try:
+                error = done.exception()
+                if error is not None:
+                    wrappedFuture.set_exception(error)
+                    return
+                result = done.result()
+                try:
+                    self.cache.set(imageHash, result)
+                except Exception as e:
+                    print(f"âš ï¸  Could not cache description: {e}")
+                wrappedFuture.set_result(result)
+            finally:
+                with self.inflightLock:
+                    self.inflight.pop(imageHash, None)
+        
+        originalFuture.add_done_callback(cacheResult)
+        return wrappedFuture
+    
+    def _requestDescription(self, imageBytes: bytes, mimeType: str,
+                            context: Optional[str] = None) -> Future:
+        # Generate description asynchronously
+        with self.statsLock:
+            self.apiCallCount += 1
+            callNumber = self.apiCallCount
+        log.debug("  â†’ API call #%d (generating description)...", callNumber)
+        return self._generateDescriptionAsync(imageBytes, mimeType, context)
+    
+    def _generateDescriptionAsync(self, imageBytes: bytes, mimeType: str = "image/png",
                                    context: Optional[str] = None):
         # Generate description asynchronously - returns a future.
         # Submit to LLM's thread pool and return future immediately
-        return self.llm.submit(self._callOpenAI, image, context)
+        return self.llm.submit(self._callOpenAI, imageBytes, mimeType, context)
     
-    def _generateDescription(self, image: Image.Image, 
+    def _generateDescription(self, imageBytes: bytes, mimeType: str = "image/png",
                             context: Optional[str] = None) -> str:
         # Generate description of image using OpenAI Vision API.
         # Submit to LLM's thread pool for parallel execution
-        future = self._generateDescriptionAsync(image, context)
+        future = self._generateDescriptionAsync(imageBytes, mimeType, context)
         return future.result()
     
-    def _callOpenAI(self, image: Image.Image, context: Optional[str] = None) -> str:
+    def _callOpenAI(self, imageBytes: bytes, mimeType: str = "image/png",
+                    context: Optional[str] = None) -> str:
         # Call OpenAI GPT-4 Vision API.
         try:
-            # Convert image to base64
-            buffered = io.BytesIO()
-            image.save(buffered, format="PNG")
-            imageBase64 = base64.b64encode(buffered.getvalue()).decode()
+            # Encoded bytes go up unchanged; only formats the API rejects are converted
+            imageBytes, mimeType = visionPayload(imageBytes, mimeType)
             
             # Build prompt
             if context:
@@ -261,31 +527,13 @@ class ImageHandler:
                 prompt = "Describe this educational diagram/figure in detail. Focus on what it illustrates and any key information shown. Be concise but comprehensive."
             
             # Call OpenAI API
-            response = requests.post(
+            response = self.httpClient.post(
                 "https://api.openai.com/v1/chat/completions",
                 headers={
                     "Authorization": f"Bearer {self.apiKey}",
                     "Content-Type": "application/json"
                 },
-                json={
-                    "model": self.model,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/png;base64,{imageBase64}"
-                                    }
-                                }
-                            ]
-                        }
-                    ],
-                    "max_tokens": 300
-                },
-                timeout=30
+                content=self._requestBody(prompt, imageBytes, mimeType)
             )
             
             if response.status_code == 200:
@@ -299,6 +547,32 @@ class ImageHandler:
                 print(f"  âŒ API error: {e}")
             return f"<ERROR: {str(e)}>"
     
+    def _requestBody(self, prompt: str, imageBytes: bytes, mimeType: str) -> bytes:
+        # JSON request body as bytes. Only the small envelope goes through json.dumps;
+        # the base64 payload (JSON-safe ASCII) is spliced in without str copies. The
+        # image part is serialized last, so the final placeholder is always ours.
+        body = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {"type": "image_url", "image_url": {"url": IMAGE_URL_SLOT[1:-1]}}
+                    ]
+                }
+            ],
+            "max_tokens": 300
+        }
+        prefix, suffix = json.dumps(body).encode('utf-8').rsplit(IMAGE_URL_SLOT.encode('ascii'), 1)
+        return b"".join([
+            prefix,
+            f'"data:{mimeType};base64,'.encode('ascii'),
+            binascii.b2a_base64(imageBytes, newline=False),
+            b'"',
+            suffix,
+        ])
+    
     def getStats(self) -> Dict[str, int]:
         # Get usage statistics.
         stats = {
@@ -308,7 +582,111 @@ class ImageHandler:
         }
         
         if self.enableCache:
+            self.cache.flush()  # so cache_size_kb reflects every description so far
             cacheStats = self.cache.stats()
             stats.update(cacheStats)
         
         return stats
+
+
+def visionPayload(imageBytes: bytes, mimeType: str):
+    # (bytes, mime) the vision API accepts. PNG/JPEG/GIF/WebP within VISION_MAX_SIDE
+    # pass through untouched; PIL is only involved when the image must change.
+    # Anything larger is downscaled, since the model tiles at lower resolution
+    # anyway, and other formats (TIFF, BMP, WMF blobs from PPTX) are re-encoded.
+    if mimeType in VISION_MIME_TYPES:
+        size = pngSize(imageBytes)
+        if size is not None and max(size) <= VISION_MAX_SIDE:
+            return imageBytes, mimeType
+    try:
+        image = Image.open(io.BytesIO(imageBytes))
+    except Exception:
+        if mimeType in VISION_MIME_TYPES:
+            return imageBytes, mimeType
+        raise
+    if mimeType in VISION_MIME_TYPES and max(image.size) <= VISION_MAX_SIDE:
+        return imageBytes, mimeType
+    if max(image.size) > VISION_MAX_SIDE:
+        image.thumbnail((VISION_MAX_SIDE, VISION_MAX_SIDE), Image.Resampling.LANCZOS)
+    return encodeForVision(image)
+
+
+def pptxImagePart(shape):
+    # (package, partname) of a picture's image part, read from the relationship
+    # without loading the Image object. Slides that reuse a picture point at the
+    # same media part.
+    try:
+        imagePart = shape.part.related_part(shape._element.blip_rId)
+        return imagePart.package, str(imagePart.partname)
+    except Exception:
+        return None
+
+
+def renderRegionPng(page, rect, zoom: float) -> bytes:
+    # PNG of a page region. Large regions are rendered as strips of whole pixel
+    # rows, each compressed into the PNG stream before the next is rendered, so
+    # the full raw bitmap never has to be resident at once.
+    mat = fitz.Matrix(zoom, zoom)
+    box = (rect * mat).irect
+    rowBytes = box.width * 3  # RGB, no alpha
+    if rowBytes * box.height <= STRIP_RENDER_MIN_BYTES:
+        return page.get_pixmap(matrix=mat, clip=rect).tobytes("png")
+    
+    stripRows = max(1, STRIP_BYTES // rowBytes)
+    writer = PngStreamWriter(box.width, box.height, 3)
+    for top in range(box.y0, box.y1, stripRows):
+        bottom = min(top + stripRows, box.y1)
+        strip = page.get_pixmap(matrix=mat, clip=fitz.Rect(rect.x0, top / zoom, rect.x1, bottom / zoom))
+        if strip.width != box.width or strip.height != bottom - top or strip.n != 3:
+            # Strip edges did not land on the expected pixel grid; render in one go
+            return page.get_pixmap(matrix=mat, clip=rect).tobytes("png")
+        writer.addRows(strip.samples, strip.stride)
+    return writer.finish()
+
+
+class PngStreamWriter:
+    # Minimal 8-bit PNG encoder fed row blocks in order (filter type 0 per row);
+    # only the compressed stream is kept in memory.
+    
+    def __init__(self, width: int, height: int, channels: int):
+        self.rowBytes = width * channels
+        colorType = {1: 0, 3: 2, 4: 6}[channels]
+        header = struct.pack(">IIBBBBB", width, height, 8, colorType, 0, 0, 0)
+        self.parts = [PNG_SIGNATURE, pngChunk(b"IHDR", header)]
+        self.compressor = zlib.compressobj()
+    
+    def addRows(self, samples, stride: int) -> None:
+        view = memoryview(samples)
+        rows = [b"\x00" + view[i:i + self.rowBytes] for i in range(0, len(view), stride)]
+        data = self.compressor.compress(b"".join(rows))
+        if data:
+            self.parts.append(pngChunk(b"IDAT", data))
+    
+    def finish(self) -> bytes:
+        self.parts.append(pngChunk(b"IDAT", self.compressor.flush()))
+        self.parts.append(pngChunk(b"IEND", b""))
+        return b"".join(self.parts)
+
+
+def pngChunk(chunkType: bytes, data: bytes) -> bytes:
+    crc = zlib.crc32(data, zlib.crc32(chunkType))
+    return struct.pack(">I", len(data)) + chunkType + data + struct.pack(">I", crc)
+
+
+def pngSize(imageBytes: bytes):
+    # (width, height) straight from a PNG's IHDR chunk, or None for other formats
+    if imageBytes[:8] != PNG_SIGNATURE or imageBytes[12:16] != b"IHDR":
+        return None
+    return struct.unpack(">II", imageBytes[16:24])
+
+
+def encodeForVision(image: Image.Image):
+    # Photo-like content (many distinct colors, no alpha) compresses far better as
+    # JPEG; diagrams and screenshots stay PNG so lines and text remain crisp.
+    buffered = io.BytesIO()
+    isPhoto = image.mode in ("RGB", "L", "CMYK", "YCbCr") and image.getcolors(PHOTO_MIN_COLORS) is None
+    if isPhoto:
+        image.convert("RGB").save(buffered, format="JPEG", quality=VISION_JPEG_QUALITY)
+        return buffered.getvalue(), "image/jpeg"
+    image.save(buffered, format="PNG")
+    return buffered.getvalue(), "image/png"
@@ -1,5 +1,8 @@
 import time
 import threading
+import hashlib
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from app.services.ingester.services.LLM import LLM
 
 def dummy_task(duration):
@@ -8,17 +11,49 @@ def dummy_task(duration):
     print(f"Task finished on thread {threading.current_thread().name}")
     return "done"
 
-def test_parallelism():
-    print("Initializing LLM...")
+def cpu_task():
+    return hashlib.sha256(b'x' * 64).digest()
+
+def make_llm(maxWorkers=10):
     # We need to mock OPENAIKEY if it's not set, but the user has it.
     # If it fails due to missing key, we might need to patch os.getenv or set it.
     try:
-        llm = LLM(maxWorkers=10)
+        return LLM(maxWorkers=maxWorkers)
     except RuntimeError as e:
         print(f"Caught expected error if key missing: {e}")
         import os
         os.environ["OPENAIKEY"] = "dummy"
-        llm = LLM(maxWorkers=10)
+        return LLM(maxWorkers=maxWorkers)
+
+def run_timed(llm, task, n, *args):
+    # Submit n tasks, recording per-task latency from submit to completion
+    latencies = [0.0] * n
+    def track(i, submitted):
+        def done(_):
+            latencies[i] = time.perf_counter() - submitted
+        return done
+
+    start = time.perf_counter()
+    futures = []
+    for i in range(n):
+        submitted_at = time.perf_counter()
+        future = llm.submit(task, *args)
+        future.add_done_callback(track(i, submitted_at))
+        futures.append(future)
+    submitted = time.perf_counter()
+    for f in futures:
+        f.result()
+    finished = time.perf_counter()
+
+    latencies.sort()
+    print(f"  submit QPS:     {n / max(submitted - start, 1e-9):,.0f}")
+    print(f"  completion QPS: {n / max(finished - start, 1e-9):,.0f}")
+    print(f"  p99 latency:    {latencies[int(0.99 * (n - 1))] * 1000:.2f} ms")
+    return finished - start
+
+def test_parallelism():
+    print("Initializing LLM...")
+    llm = make_llm(maxWorkers=10)
 
     print("Submitting 5 tasks of 2 seconds each...")
     start_time = time.time()
@@ -39,5 +74,51 @@ def test_parallelism():
     else:
         print("FAILURE: Tasks ran sequentially.")
 
+def test_submit_overhead(n=1000):
+    # Tiny CPU-bound tasks: the run time is dominated by submit/queue/dispatch cost
+    print(f"Submitting {n} tiny CPU-bound tasks...")
+    llm = make_llm(maxWorkers=10)
+    run_timed(llm, cpu_task, n)
+
+class SlowHandler(BaseHTTPRequestHandler):
+    # Mock endpoint: every GET waits like a remote API would, then answers
+    delay = 0.05
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # default backlog of 5 would queue the burst in the kernel
+
+def test_io_concurrency(n=100, maxWorkers=10):
+    # Blocking HTTP calls against a local endpoint: with maxWorkers threads the
+    # run should take about n / maxWorkers * delay, not n * delay
+    server = MockServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    try:
+        print(f"Submitting {n} HTTP requests ({SlowHandler.delay * 1000:.0f} ms each)...")
+        llm = make_llm(maxWorkers=maxWorkers)
+        duration = run_timed(llm, lambda: urllib.request.urlopen(url).read(), n)
+    finally:
+        server.shutdown()
+
+    ideal = n / maxWorkers * SlowHandler.delay
+    if duration < ideal * 2:
+        print(f"SUCCESS: I/O overlapped ({duration:.2f}s, ideal {ideal:.2f}s).")
+    else:
+        print(f"FAILURE: I/O serialized ({duration:.2f}s, ideal {ideal:.2f}s).")
+    assert duration < 2 * ideal, f"I/O serialized: {duration:.2f}s vs ideal {ideal:.2f}s"
+
 if __name__ == "__main__":
     test_parallelism()
+    test_submit_overhead()
+    test_io_concurrency()
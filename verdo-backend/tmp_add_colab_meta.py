@@ -1,8 +1,27 @@
 import json
-for p in ['app/services/ingester/tests/test_pdf.ipynb','app/services/ingester/tests/test_pptx.ipynb']:
-    with open(p,encoding='utf-8') as f:
-        nb=json.load(f)
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+def load_notebook(p):
+    with open(p,'rb') as f:
+        data=f.read()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+paths=['app/services/ingester/tests/test_pdf.ipynb','app/services/ingester/tests/test_pptx.ipynb']
+
+def patch_one(p):
+    nb=load_notebook(p)
     nb.setdefault('metadata',{})['colab']={'name':'VSCode-Colab-Ready'}
     with open(p,'w',encoding='utf-8') as f:
         json.dump(nb,f,ensure_ascii=False,indent=1)
-    print('Updated colab metadata for', p)
\ No newline at end of file
+    return p
+
+if __name__=='__main__':
+    # Notebooks are independent, so each is parsed and rewritten in its own process
+    with ProcessPoolExecutor() as pool:
+        for p in pool.map(patch_one, paths):
+            print('Updated colab metadata for', p)
\ No newline at end of file
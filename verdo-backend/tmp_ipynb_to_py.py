@@ -1,29 +1,47 @@
 import json, re
 from pathlib import Path
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# Colab-only lines and blocks, removed in one pass over the converted source
+STRIP_COLAB=re.compile(
+    r"^![^\n]*"
+    r"|try:\n\s*import google\.colab.*?except Exception:.*?\n"
+    r"|from google\.colab import drive.*?drive\.mount\(.*?\)\n"
+    r"|from google\.colab import userdata.*?\n"
+    r"|IN_COLAB\s*=\s*(?:True|False).*?\n"
+    r"|if IN_COLAB:.*?\n(?:\s{4,}.*?\n)+",
+    re.M|re.S,
+)
+BLANK_RUNS=re.compile(r"\n{3,}")
+LINE_STARTS=re.compile(r"^",re.M)
+
+def load_notebook(p):
+    # One bulk read and a C-level UTF-8 decode + parse when orjson is installed
+    with open(p,'rb') as f:
+        data=f.read()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
 def ipynb_to_py(ipynb_path: Path, py_path: Path):
-    nb=json.load(open(ipynb_path,'r',encoding='utf-8'))
+    nb=load_notebook(ipynb_path)
     lines=[]
     for cell in nb.get('cells',[]):
         if cell.get('cell_type')=='markdown':
             src=''.join(cell.get('source',[]))
-            lines.append('# ' + '\n# '.join(src.splitlines()) + '\n\n')
+            # Comment out every line in one C-level pass; like splitlines(), a single
+            # trailing newline does not start another line
+            if src.endswith('\n'):
+                src=src[:-1]
+            lines.append(LINE_STARTS.sub('# ',src)+'\n\n')
         elif cell.get('cell_type')=='code':
             src=''.join(cell.get('source',[]))
             lines.append(src.rstrip()+"\n\n")
     code=''.join(lines)
-    code=re.sub(r"^!.*$","",code,flags=re.M)
-    removals=[
-        r"(?s)try:\n\s*import google\.colab.*?except Exception:.*?\n",
-        r"(?s)from google\.colab import drive.*?drive\.mount\(.*?\)\n",
-        r"(?s)from google\.colab import userdata.*?\n",
-        r"(?s)IN_COLAB\s*=\s*True.*?\n",
-        r"(?s)IN_COLAB\s*=\s*False.*?\n",
-        r"(?s)if IN_COLAB:.*?\n(\s{4,}.*?\n)+",
-    ]
-    for pat in removals:
-        code=re.sub(pat,'',code)
-    code=re.sub(r"\n{3,}","\n\n",code)
+    code=STRIP_COLAB.sub('',code)
+    code=BLANK_RUNS.sub("\n\n",code)
     py_path.write_text(code,encoding='utf-8')
 
 pairs=[
@@ -1,9 +1,21 @@
 import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+def load_notebook(p):
+    with open(p,'rb') as f:
+        data=f.read()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
 paths=[Path('app/services/ingester/tests/test_pdf.ipynb'),Path('app/services/ingester/tests/test_pptx.ipynb')]
-for p in paths:
-    nb=json.load(open(p,'r',encoding='utf-8'))
+
+def patch_one(p):
+    nb=load_notebook(p)
     new_cells=[]
     if nb['cells'] and nb['cells'][0]['cell_type']=='markdown':
         new_cells.append(nb['cells'][0])
@@ -86,5 +98,13 @@ for p in paths:
     ks.setdefault('display_name','Python 3')
     ks.setdefault('language','python')
     ks.setdefault('name','python3')
-    json.dump(nb, open(p,'w',encoding='utf-8'), ensure_ascii=False, indent=1)
-    print('Patched', p)
\ No newline at end of file
+    # nbformat's own layout (indent=1), which orjson cannot emit
+    with open(p,'w',encoding='utf-8') as f:
+        json.dump(nb, f, ensure_ascii=False, indent=1)
+    return p
+
+if __name__=='__main__':
+    # Notebooks are independent, so each is parsed and rewritten in its own process
+    with ProcessPoolExecutor() as pool:
+        for p in pool.map(patch_one, paths):
+            print('Patched', p)